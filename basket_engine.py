@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+from sorted_runs import KeyCodes, SortedRuns
+
+PAIR_COLUMNS = ["Product Pair", "Frequency", "Support", "Confidence", "Lift", "Label"]
+
+
+# Market-basket co-occurrence engine over distinct (basket, product) entries
+class ProductPairEngine:
+    # Entries are stored as basket code * 2 ** 32 + product code
+    ITEM_BITS = 32
+
+    def __init__(self, df: pd.DataFrame, basket_key="CustomerID", item_key="ProductName"):
+        """Count pairs of df's purchases; basket_key may be a column or list of columns
+        (e.g. "CustomerID" for per-customer or "TransactionID" for per-transaction baskets)"""
+        # scipy is imported by the first engine built, not by importing the pipeline
+        from scipy import sparse
+
+        self.basket_key = basket_key
+        self.item_key = item_key
+        self.basket_codes = KeyCodes(self._basket_keys(df.iloc[:0]))
+        self.items = pd.Index([], dtype=object)
+        self.entries = SortedRuns(np.int64)
+        self.co_occurrence = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self.item_counts = np.zeros(0, dtype=np.int64)
+        self.add(df)
+
+    @property
+    def n_baskets(self) -> int:
+        return len(self.basket_codes)
+
+    def _basket_keys(self, df: pd.DataFrame) -> pd.Index:
+        if isinstance(self.basket_key, (list, tuple)):
+            return pd.MultiIndex.from_frame(df[list(self.basket_key)])
+        return pd.Index(df[self.basket_key])
+
+    def add(self, df: pd.DataFrame):
+        """Fold new purchases in; cost scales with the purchases and the baskets they touch, not the history"""
+        if df.empty:
+            return self
+        from scipy import sparse
+        baskets = self._basket_keys(df)
+        items = pd.Index(np.asarray(df[self.item_key], dtype=object))
+
+        # New products get new columns; the first batch is sorted so codes follow name order
+        new_items = items.unique().difference(self.items, sort=False)
+        if len(new_items):
+            self.items = self.items.append(new_items.sort_values() if not len(self.items) else new_items)
+        n_items = len(self.items)
+        if self.co_occurrence.shape[0] < n_items:
+            co_occurrence = self.co_occurrence.copy()
+            co_occurrence.resize((n_items, n_items))
+            self.co_occurrence = co_occurrence
+            self.item_counts = np.concatenate([self.item_counts,
+                                               np.zeros(n_items - len(self.item_counts), np.int64)])
+
+        basket_codes = self.basket_codes.get_indexer(baskets)
+        unknown = basket_codes < 0
+        if unknown.any():
+            self.basket_codes.append(baskets[unknown].unique())
+            basket_codes[unknown] = self.basket_codes.get_indexer(baskets[unknown])
+
+        # Repeat purchases of the same product count once per basket
+        entries = np.unique((basket_codes << self.ITEM_BITS) | self.items.get_indexer(items))
+        added = entries[~self.entries.contains(entries)]
+        if not len(added):
+            return self
+        touched, rows = np.unique(added >> self.ITEM_BITS, return_inverse=True)
+        known = self.entries.within(touched << self.ITEM_BITS, (touched + 1) << self.ITEM_BITS)
+        self.entries.add(added)
+
+        mask = (1 << self.ITEM_BITS) - 1
+        new = sparse.csr_matrix((np.ones(len(added), dtype=np.int64), (rows, added & mask)),
+                                shape=(len(touched), n_items))
+        before = sparse.csr_matrix((np.ones(len(known), dtype=np.int64),
+                                    (np.searchsorted(touched, known >> self.ITEM_BITS), known & mask)),
+                                   shape=(len(touched), n_items))
+        # Pairs gained by the touched baskets: new products with their earlier ones and with each other
+        gained = before.T @ new
+        self.co_occurrence = (self.co_occurrence + gained + gained.T + new.T @ new).tocsr()
+        self.item_counts = self.item_counts + np.bincount(added & mask, minlength=n_items)
+        return self
+
+    def baskets(self) -> pd.DataFrame:
+        """Distinct (basket, product) rows, enough to rebuild or merge this engine elsewhere"""
+        entries = self.entries.values()
+        keys = self.basket_codes.index()[entries >> self.ITEM_BITS]
+        frame = keys.to_frame(index=False) if isinstance(keys, pd.MultiIndex) else \
+            pd.DataFrame({self.basket_key: keys})
+        frame[self.item_key] = self.items[entries & ((1 << self.ITEM_BITS) - 1)]
+        return frame
+
+    def merge(self, other: "ProductPairEngine"):
+        return self.add(other.baskets())
+
+    def copy(self) -> "ProductPairEngine":
+        """Copy that add() and merge() leave this engine untouched by; the sorted runs are shared"""
+        copy = object.__new__(ProductPairEngine)
+        vars(copy).update(vars(self))
+        copy.basket_codes = self.basket_codes.copy()
+        copy.entries = self.entries.copy()
+        return copy
+
+    def pairs(self, top_n=10, min_support=0.0, min_confidence=0.0, min_lift=0.0) -> pd.DataFrame:
+        """Most frequent product pairs, optionally filtered by support, confidence and lift, ranked by pair_table()"""
+        co = self.co_occurrence.tocoo()
+        names = np.asarray(self.items, dtype=object)
+        upper = (co.row < co.col) & (co.data > 0)
+        row, col, frequency = co.row[upper], co.col[upper], co.data[upper].astype(np.int64)
+        return pair_table(names[row], names[col], frequency, self.item_counts[row], self.item_counts[col],
+                          self.n_baskets, top_n, min_support, min_confidence, min_lift)
+
+
+def pair_table(names_a, names_b, frequency, count_a, count_b, n_baskets, top_n=10, min_support=0.0,
+               min_confidence=0.0, min_lift=0.0) -> pd.DataFrame:
+    """Rank product pairs by the number of baskets holding both, given each product's basket count.
+
+    Each pair is reported with the alphabetically first product first. Confidence is that of the
+    stronger rule direction (A -> B or B -> A). Ties in frequency are broken by product name so the
+    ranking is deterministic whichever engine counted the pairs."""
+    names_a, names_b = np.asarray(names_a, dtype=object), np.asarray(names_b, dtype=object)
+    frequency = np.asarray(frequency, dtype=np.int64)
+    count_a, count_b = np.asarray(count_a, dtype=np.int64), np.asarray(count_b, dtype=np.int64)
+    if not len(frequency) or not n_baskets:
+        return pd.DataFrame(columns=PAIR_COLUMNS)
+    swap = names_a > names_b
+    first, second = np.where(swap, names_b, names_a), np.where(swap, names_a, names_b)
+    count_first, count_second = np.where(swap, count_b, count_a), np.where(swap, count_a, count_b)
+
+    support = frequency / n_baskets
+    confidence = frequency / np.minimum(count_first, count_second)
+    lift = frequency * n_baskets / (count_first * count_second)
+
+    keep = (support >= min_support) & (confidence >= min_confidence) & (lift >= min_lift)
+    order = np.lexsort((second, first, -frequency))
+    order = order[keep[order]]
+    if top_n is not None:
+        order = order[:top_n]
+    first, second = first[order], second[order]
+    return pd.DataFrame({
+        "Product Pair": list(zip(first, second)),
+        "Frequency": frequency[order],
+        "Support": support[order],
+        "Confidence": confidence[order],
+        "Lift": lift[order],
+        "Label": [f"{a} & {b}" for a, b in zip(first, second)],
+    })
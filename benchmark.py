@@ -0,0 +1,201 @@
+"""Benchmarks for the ingestion, processing, analysis and search stages on synthetic sales data.
+
+Usage:
+    python benchmark.py --rows 10000 1000000 10000000 --output bench.json
+    python benchmark.py --rows 100000 --basket-width 200 --compare bench.json
+
+Cold import times of the pipeline, the CLI and the dashboard are reported first, as import_* stages.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pipeline import DataAnalysisModule, DataIngestionModule, DataProcessingModule, SalesFilter, required_columns
+import profiling
+
+REGIONS = ["Colombo", "Kandy", "Galle", "Jaffna", "Kurunegala"]
+
+ANALYSIS_METHODS = [
+    "best_selling_products_analysis", "monthly_sales_analysis", "regional_sales_analysis",
+    "sales_by_day_analysis", "frequent_customers_analysis", "average_purchase_value_analysis",
+    "customer_recency_analysis", "customer_purchase_frequency_analysis", "top_product_pairs_analysis",
+    "customer_rfm_analysis", "rfm_segments_analysis",
+]
+RESULT_NAMES = [method[:-len("_analysis")] for method in ANALYSIS_METHODS] + ["sales_cube", "product_search_index"]
+
+# Entry points whose import cost is every start of the CLI and every cold start of the dashboard
+IMPORT_MODULES = ["pipeline", "cli", "main"]
+
+
+def generate_sales(rows: int, customers: int = None, products: int = 50, basket_width: int = 10,
+                   seed: int = 0) -> pd.DataFrame:
+    """Synthetic frame with the supermarket_sales_enhanced.csv schema.
+
+    Each customer buys from a window of basket_width consecutive products, which controls the
+    number of distinct products per customer and so the cost of the pair analysis."""
+    rng = np.random.default_rng(seed)
+    customers = customers or max(rows // 5, 1)
+    basket_width = min(basket_width, products)
+    customer_ids = rng.integers(1, customers + 1, rows)
+    product_codes = (customer_ids * 7919 + rng.integers(0, basket_width, rows)) % products
+    prices = np.round(rng.uniform(0.5, 20, products) * 2) / 2
+    quantity = rng.integers(1, 11, rows)
+    dates = pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D")
+    return pd.DataFrame({
+        "TransactionID": np.arange(1, rows + 1),
+        "CustomerID": customer_ids,
+        "ProductID": 100 + product_codes,
+        "ProductName": pd.Categorical.from_codes(product_codes, [f"Product {code:05d}" for code in range(products)]),
+        "Quantity": quantity,
+        "PriceperUnit": prices[product_codes],
+        "Date": dates.strftime("%-m/%-d/%Y") if os.name != "nt" else dates.strftime("%m/%d/%Y"),
+        "TotalPrice": quantity * prices[product_codes],
+        "Region": pd.Categorical.from_codes(rng.integers(0, len(REGIONS), rows), REGIONS),
+    })
+
+
+def measure_imports(modules=IMPORT_MODULES, repeat: int = 3) -> list:
+    """Import time of each module in a fresh interpreter, the best of repeat runs"""
+    records = []
+    for module in modules:
+        script = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        runs = [subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               check=True, capture_output=True, text=True) for _ in range(repeat)]
+        seconds = min(float(run.stdout.split()[-1]) for run in runs)
+        records.append({"stage": f"import_{module}", "rows_in": None, "rows_out": None, "seconds": seconds,
+                        "peak_mb": None, "rows": 0})
+    return records
+
+
+def run_benchmarks(rows: int, customers=None, products=50, basket_width=10, chunksize=1_000_000,
+                   trace_memory=True) -> list:
+    """Time and memory-profile every pipeline stage at one data size"""
+    records = []
+
+    def measure(stage, records, rows_in):
+        return profiling.measure(stage, records, rows_in, trace_memory)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sales.csv")
+        generate_sales(rows, customers, products, basket_width).to_csv(path, index=False)
+
+        with measure("load_data", records, rows) as step:
+            raw_data = DataIngestionModule.load_data(path)
+            step["rows_out"] = len(raw_data)
+        with measure("load_data_pruned", records, rows) as step:
+            columns = required_columns(RESULT_NAMES) + list(DataProcessingModule.COLUMNS)
+            step["rows_out"] = len(DataIngestionModule.load_data(path, columns))
+        with measure("process_data", records, len(raw_data)) as step:
+            processed = DataProcessingModule(raw_data).process_data()
+            step["rows_out"] = len(processed)
+        with measure("load_aggregates", records, rows) as step:
+            step["rows_out"] = DataIngestionModule.load_aggregates(path, chunksize).rows
+
+    # Each method runs on a fresh module so its shared intermediates are included in its cost
+    for method in ANALYSIS_METHODS:
+        with measure(method, records, len(processed)) as step:
+            step["rows_out"] = len(getattr(DataAnalysisModule(processed), method)())
+
+    # Data preparation behind the dashboard pages
+    analysis = DataAnalysisModule(processed)
+    with measure("sales_cube", records, len(processed)) as step:
+        step["rows_out"] = len(analysis.cube().cells)
+    with measure("product_search_index", records, len(processed)) as step:
+        search_index = analysis.analyze()["product_search_index"]
+        step["rows_out"] = len(search_index.names)
+    with measure("product_search", records, len(processed)) as step:
+        matches = search_index.search("product 0")
+        search_index.totals(matches)
+        search_index.regional(matches)
+        search_index.monthly(matches)
+        step["rows_out"] = len(matches)
+
+    # Every page of the unfiltered view against a one-quarter window served from the Date-sorted frame
+    with measure("all_analyses", records, len(processed)) as step:
+        results = DataAnalysisModule(processed).analyze()
+        for name in RESULT_NAMES:
+            results[name]
+        step["rows_out"] = len(processed)
+    with measure("scheduled_analyses", records, len(processed)) as step:
+        results = DataAnalysisModule(processed).analyze()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results.prefetch(executor, RESULT_NAMES)
+        step["rows_out"] = len(processed)
+    analysis = DataAnalysisModule(processed)
+    with measure("date_index", records, len(processed)) as step:
+        step["rows_out"] = len(analysis.date_index().days)
+    start = processed["Date"].min()
+    with measure("filtered_quarter_analyses", records, len(processed)) as step:
+        view, results = analysis.view(SalesFilter(start=start, end=start + pd.Timedelta(days=90)))
+        for name in RESULT_NAMES:
+            results[name]
+        step["rows_out"] = len(view.df)
+
+    for record in records:
+        record.update(rows=rows, customers=customers, products=products, basket_width=basket_width)
+    return records
+
+
+def compare(records, baseline_path, tolerance=0.25) -> list:
+    """Stages that got slower than the baseline by more than tolerance"""
+    with open(baseline_path) as handle:
+        baseline = {(record["stage"], record["rows"]): record for record in json.load(handle)["results"]}
+    regressions = []
+    for record in records:
+        previous = baseline.get((record["stage"], record["rows"]))
+        if previous and record["seconds"] > previous["seconds"] * (1 + tolerance) and record["seconds"] > 0.01:
+            regressions.append({"stage": record["stage"], "rows": record["rows"],
+                                "baseline_seconds": previous["seconds"], "seconds": record["seconds"]})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the sales analysis pipeline on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--customers", type=int, help="distinct customers (default rows / 5)")
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--basket-width", type=int, default=10, help="distinct products each customer buys from")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="chunk size for streaming ingestion")
+    parser.add_argument("--no-memory", action="store_true", help="skip memory tracing for more accurate timings")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing --compare")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    records = []
+    for rows in [None] + args.rows:
+        results = measure_imports() if rows is None else \
+            run_benchmarks(rows, args.customers, args.products, args.basket_width, args.chunksize,
+                           trace_memory=not args.no_memory)
+        for record in results:
+            peak = "" if record["peak_mb"] is None else f"{record['peak_mb']:>9.1f}MB"
+            print(f"{record['rows']:>11,} {record['stage']:<40} {record['seconds']:>9.3f}s {peak}")
+        records.extend(results)
+
+    report = {
+        "environment": {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__},
+        "results": records,
+    }
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+    if args.compare:
+        regressions = compare(records, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Headless batch runner: ingest, process and analyse sales CSVs without Streamlit.
+
+Usage:
+    python cli.py supermarket_sales.csv --output-dir reports
+    python cli.py "exports/*.csv" --workers 8 --format parquet
+    python cli.py huge_export.csv --chunksize 500000
+    python cli.py "exports/*.csv" --backend duckdb --memory-limit 8GB
+"""
+import argparse
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from duckdb_backend import BACKENDS, DEFAULT_BACKEND, DEFAULT_MEMORY_LIMIT, DuckDBAnalysisModule
+from pipeline import ANALYSES, DataAnalysisModule, DataIngestionModule, DataProcessingModule, SalesCube, required_columns
+
+# Result types a batch run writes, every registered analysis returning one of them is exported; the cube is
+# exported as its cells and objects such as the product search index are skipped
+TABULAR_RESULTS = (pd.Series, pd.DataFrame, SalesCube)
+
+
+def build_analysis(sources, chunksize=None, workers=None, dedup_key=None, backend="pandas",
+                   memory_limit=DEFAULT_MEMORY_LIMIT) -> DataAnalysisModule:
+    """Run the pipeline in-memory, streamed in chunks, across partitions in a process pool, or out-of-core in DuckDB"""
+    paths = DataIngestionModule.expand_sources(sources)
+    if backend == "duckdb":
+        if dedup_key:
+            raise ValueError("The duckdb backend drops duplicate rows by all columns; --dedup-key needs pandas")
+        return DuckDBAnalysisModule(paths, memory_limit=memory_limit)
+    if len(paths) > 1 or workers:
+        aggregates = DataIngestionModule.load_partitions(paths, max_workers=workers,
+                                                         chunksize=chunksize or 100_000, dedup_key=dedup_key)
+        return DataAnalysisModule.from_aggregates(aggregates)
+    if chunksize:
+        return DataAnalysisModule.from_aggregates(
+            DataIngestionModule.load_aggregates(paths[0], chunksize, dedup_key=dedup_key))
+    # Only the columns the registered analyses declare are read
+    columns = required_columns(list(ANALYSES)) + list(DataProcessingModule.COLUMNS) + ([dedup_key] if dedup_key else [])
+    raw_data = DataIngestionModule.load_data(paths[0], columns)
+    if not len(raw_data.columns):
+        # load_data has logged why
+        raise ValueError(f"Could not read {paths[0]}")
+    return DataAnalysisModule(DataProcessingModule(raw_data, dedup_key=dedup_key).process_data())
+
+
+def result_frame(result) -> pd.DataFrame:
+    """Flatten an analysis result into a frame that JSON and Parquet writers accept"""
+    if isinstance(result, SalesCube):
+        result = result.cells
+    frame = result.reset_index() if isinstance(result, pd.Series) else result.copy()
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.PeriodDtype):
+            frame[column] = frame[column].astype(str)
+        elif frame[column].dtype == object and len(frame) and isinstance(frame[column].iloc[0], tuple):
+            frame[column] = frame[column].map(list)
+    return frame
+
+
+def write_results(results, output_dir, fmt="json") -> list:
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for name in results:
+        result = results[name]
+        if not isinstance(result, TABULAR_RESULTS):
+            continue
+        frame = result_frame(result)
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        if fmt == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_json(path, orient="records", date_format="iso", indent=2)
+        written.append(path)
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the supermarket sales analysis pipeline without the dashboard.")
+    parser.add_argument("sources", nargs="+", help="CSV files, a directory of CSVs or a glob pattern")
+    parser.add_argument("--output-dir", default="reports", help="directory for the result files")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json")
+    parser.add_argument("--chunksize", type=int, help="stream the input in chunks of this many rows")
+    parser.add_argument("--workers", type=int, help="process pool size for multi-file input")
+    parser.add_argument("--dedup-key", help="column identifying duplicate rows, e.g. TransactionID")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help="duckdb runs out-of-core, spilling to disk beyond --memory-limit")
+    parser.add_argument("--memory-limit", default=DEFAULT_MEMORY_LIMIT, help="duckdb memory limit, e.g. 8GB")
+    args = parser.parse_args(argv)
+    if args.backend == "duckdb" and args.dedup_key:
+        parser.error("--dedup-key is only supported by the pandas backend")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sources = args.sources[0] if len(args.sources) == 1 else args.sources
+    try:
+        analysis = build_analysis(sources, args.chunksize, args.workers, args.dedup_key, args.backend,
+                                  args.memory_limit)
+    except Exception as e:
+        # Nothing is written from partly read input
+        logging.error(f"Batch run failed: {str(e)}")
+        return 1
+    for path in write_results(analysis.analyze(), args.output_dir, args.format):
+        logging.info(f"Wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+DEFAULT_CACHE_DIR = os.environ.get("DASHBOARD_CACHE_DIR", ".dashboard_cache")
+
+
+# On-disk Parquet cache of processed frames, shared by sessions and worker processes
+class ColumnarCache:
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key.replace(":", "-") + ".parquet")
+
+    def load(self, key: str, columns=None):
+        """Memory-mapped read of the cached frame, limited to the given columns; None on a miss"""
+        path = self.path(key)
+        if not PARQUET_AVAILABLE or not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path, columns=columns, memory_map=True)
+            logging.info(f"Loaded {len(df)} rows from columnar cache {path}.")
+            return df
+        except Exception as e:
+            logging.error(f"Columnar cache read failed: {str(e)}")
+            return None
+
+    def save(self, key: str, df: pd.DataFrame):
+        """Write the frame atomically so concurrent readers never see a partial file"""
+        if not PARQUET_AVAILABLE or df.empty:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            os.close(handle)
+            try:
+                df.to_parquet(temp_path, index=False)
+                os.replace(temp_path, self.path(key))
+            finally:
+                # Left behind only when the write or rename failed
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except Exception as e:
+            logging.error(f"Columnar cache write failed: {str(e)}")
+
+    def invalidate(self, key: str) -> bool:
+        path = self.path(key)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from pipeline_cache import estimate_nbytes
+from profiling import instrument
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("DASHBOARD_STORE_MAX_MB", 4096)) * 1024 ** 2)
+
+
+class _Entry:
+    def __init__(self, key, df):
+        self.key = key
+        self.df = df
+        self.nbytes = estimate_nbytes(df)
+        self.refcount = 0
+
+
+# A session's reference to a stored dataset, released explicitly or when the session is garbage collected
+class DatasetHandle:
+    def __init__(self, store: "DatasetStore", entry: _Entry):
+        self.key = entry.key
+        self.df = entry.df
+        self._release = weakref.finalize(self, store._release, entry)
+
+    def release(self):
+        """Drop this reference; safe to call more than once"""
+        self._release()
+
+
+# Processed datasets keyed by content hash and shared by every session, so identical uploads are held once
+class DatasetStore:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, spill_cache=None, columns=None):
+        """Unreferenced datasets beyond max_bytes are evicted least recently used first. With a
+        spill_cache (e.g. ColumnarCache) they are written to disk on eviction and read back,
+        limited to columns, on the next acquire instead of being rebuilt."""
+        self.max_bytes = max_bytes
+        self.spill_cache = spill_cache
+        self.columns = columns
+        self.evict_listeners = []
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, loader) -> DatasetHandle:
+        """Reference the dataset for key, loading it from the spill cache or loader() if it is not held"""
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        # Concurrent sessions uploading the same file wait for a single load
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return self._reference(entry)
+            with instrument("dataset_store") as step:
+                df = self.spill_cache.load(key, columns=self.columns) if self.spill_cache is not None else None
+                step["cache"] = "miss" if df is None else "spill"
+                if df is None:
+                    df = loader()
+                step["rows_out"] = len(df)
+            with self._lock:
+                entry = self._entries[key] = _Entry(key, df)
+                handle = self._reference(entry)
+                evicted = self._evict()
+                self._loading.pop(key, None)
+        self._spill(evicted)
+        return handle
+
+    def _reference(self, entry: _Entry) -> DatasetHandle:
+        entry.refcount += 1
+        return DatasetHandle(self, entry)
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refcount -= 1
+            evicted = self._evict()
+        self._spill(evicted)
+
+    def _evict(self) -> list:
+        """Pop unreferenced entries, least recently used first, until within budget; call with the lock held"""
+        evicted = []
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if self._entries[key].refcount <= 0:
+                evicted.append(self._entries.pop(key))
+        if self.total_bytes > self.max_bytes:
+            logging.warning(f"Dataset store holds {self.total_bytes / 1024 ** 2:.0f} MB of referenced datasets, "
+                            f"over its {self.max_bytes / 1024 ** 2:.0f} MB budget.")
+        return evicted
+
+    def _spill(self, evicted):
+        for entry in evicted:
+            if self.spill_cache is not None and entry.key not in self.spill_cache:
+                self.spill_cache.save(entry.key, entry.df)
+            logging.info(f"Evicted dataset {entry.key} ({entry.nbytes / 1024 ** 2:.1f} MB) from the store.")
+            for listener in self.evict_listeners:
+                listener(entry.key)
+
+    def invalidate(self, key) -> bool:
+        """Forget a dataset even if referenced; existing handles keep their frame until released"""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def refcount(self, key) -> int:
+        entry = self._entries.get(key)
+        return entry.refcount if entry is not None else 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
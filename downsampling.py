@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Point budgets that bound what a single chart or table sends to the browser
+MAX_SERIES_POINTS = 500
+MAX_BARS = 20
+TABLE_PAGE_SIZE = 100
+
+
+def lttb(series: pd.Series, threshold: int = MAX_SERIES_POINTS) -> pd.Series:
+    """Largest-Triangle-Three-Buckets downsampling of an evenly spaced series to at most threshold points.
+
+    The first and last points are always kept; each bucket in between keeps the point forming the
+    largest triangle with the previously kept point and the mean of the next bucket, so peaks survive."""
+    n = len(series)
+    if threshold >= n or threshold < 3:
+        return series
+    y = np.nan_to_num(series.to_numpy(dtype="float64"))
+    x = np.arange(n, dtype="float64")
+    every = (n - 2) / (threshold - 2)
+
+    selected = [0]
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start = int(math.floor(bucket * every)) + 1
+        end = int(math.floor((bucket + 1) * every)) + 1
+        next_end = min(int(math.floor((bucket + 2) * every)) + 1, n)
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[anchor] - next_x) * (y[start:end] - y[anchor])
+                      - (x[anchor] - x[start:end]) * (next_y - y[anchor]))
+        anchor = start + int(np.argmax(area))
+        selected.append(anchor)
+    selected.append(n - 1)
+    return series.iloc[selected]
+
+
+def top_n_with_other(series: pd.Series, n: int = MAX_BARS, other_label="Other") -> pd.Series:
+    """Largest n categories in descending order plus one bucket summing the rest; short series pass through"""
+    if len(series) <= n:
+        return series
+    top = series.nlargest(n)
+    other = pd.Series([series.drop(top.index).sum()], index=pd.Index([other_label]), name=series.name)
+    return pd.concat([top.set_axis(top.index.astype(object)), other])
+
+
+def page_count(rows: int, page_size: int = TABLE_PAGE_SIZE) -> int:
+    return max(math.ceil(rows / page_size), 1)
+
+
+def paginate(frame: pd.DataFrame, page: int = 1, page_size: int = TABLE_PAGE_SIZE) -> pd.DataFrame:
+    """One 1-based page of a frame; out-of-range pages are clamped"""
+    page = min(max(page, 1), page_count(len(frame), page_size))
+    return frame.iloc[(page - 1) * page_size:page * page_size]
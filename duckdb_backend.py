@@ -0,0 +1,310 @@
+"""Out-of-core execution of the registered analyses with DuckDB.
+
+The shared intermediates (sales cube, customer summary, purchase-value counts, product pairs) are
+computed by SQL over the CSV or Parquet source, within a memory limit and spilling to disk beyond
+it; every analysis then runs on them unchanged, so results match the pandas backend."""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from basket_engine import pair_table
+from columnar_cache import DEFAULT_CACHE_DIR
+from pipeline import DataAnalysisModule, DataIngestionModule, DataProcessingModule, SalesCube
+from profiling import instrument
+from rfm import SEGMENT_GRID, SEGMENTS
+
+BACKENDS = ["pandas", "duckdb"]
+DEFAULT_BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas")
+DEFAULT_MEMORY_LIMIT = os.environ.get("DASHBOARD_DUCKDB_MEMORY", "2GB")
+DEFAULT_TEMP_DIRECTORY = os.environ.get("DASHBOARD_DUCKDB_TEMP", os.path.join(DEFAULT_CACHE_DIR, "duckdb"))
+
+ROW_LEVEL_ONLY = ("The duckdb backend does not hold row-level data in memory; filters, approximate mode and "
+                  "appended batches need the pandas backend")
+
+
+def sql_literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# DataAnalysisModule whose full-data passes run in an embedded DuckDB database instead of pandas
+class DuckDBAnalysisModule(DataAnalysisModule):
+    def __init__(self, sources, processed=False, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 temp_directory=DEFAULT_TEMP_DIRECTORY, threads=None):
+        """sources is a CSV path, glob or list of paths, or Parquet of already processed rows when processed=True.
+
+        Raw CSV rows are cleaned like DataProcessingModule once, into an on-disk table; queries
+        beyond memory_limit spill to temp_directory."""
+        # Imported here so the pandas backend never pays for it
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("The duckdb backend needs the duckdb package: pip install duckdb") from None
+        super().__init__(None)
+        self.sources = DataIngestionModule.expand_sources(sources)
+        self.processed = processed
+        os.makedirs(temp_directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="analysis-", dir=temp_directory)
+        config = {"memory_limit": memory_limit, "temp_directory": self.directory,
+                  "preserve_insertion_order": False}
+        if threads:
+            config["threads"] = threads
+        self.connection = duckdb.connect(os.path.join(self.directory, "sales.duckdb"), config=config)
+        self._connection_lock = threading.Lock()
+        self._close = weakref.finalize(self, self._cleanup, self.connection, self.directory)
+
+    @classmethod
+    def from_upload(cls, file, **options) -> "DuckDBAnalysisModule":
+        """Analyse an uploaded file-like object, spooled into the database directory so that close()
+        deletes it along with the database"""
+        analysis = cls([], **options)
+        path = os.path.join(analysis.directory, "upload.csv")
+        with open(path, "wb") as handle:
+            handle.write(file.getvalue())
+        analysis.sources = [path]
+        return analysis
+
+    @staticmethod
+    def _cleanup(connection, directory):
+        connection.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def close(self):
+        """Close the database and delete its files; safe to call more than once"""
+        self._close()
+
+    def query(self, sql: str) -> pd.DataFrame:
+        # Each query gets its own cursor, so analyses on different threads can query concurrently
+        with self._connection_lock:
+            cursor = self.connection.cursor()
+        try:
+            return cursor.execute(sql).df()
+        finally:
+            cursor.close()
+
+    def sales(self) -> dict:
+        """Materialize the cleaned rows once; returns the DuckDB type of each column"""
+        return self.intermediate("sales", self._create_sales)
+
+    def _create_sales(self) -> dict:
+        files = "[" + ", ".join(sql_literal(path) for path in self.sources) + "]"
+        if self.processed:
+            self.query(f"CREATE VIEW sales AS SELECT * FROM read_parquet({files})")
+            return self._column_types("sales")
+        self.query(f"CREATE VIEW raw_sales AS SELECT * FROM read_csv({files}, header = true, union_by_name = true, "
+                   f"types = {{'{DataIngestionModule.DATE_COLUMN}': 'VARCHAR'}})")
+        types = self._column_types("raw_sales")
+        expected = "Quantity * PriceperUnit"
+        if "TotalPrice" in types:
+            total = (f"CASE WHEN abs(TotalPrice - {expected}) > {DataProcessingModule.TOTAL_PRICE_TOLERANCE} "
+                     f"THEN {expected} ELSE TotalPrice END AS TotalPrice")
+            select = f"* REPLACE ({total})"
+        else:
+            select = f"*, {expected} AS TotalPrice"
+        # Same steps as DataProcessingModule: parse dates, drop duplicate rows and rows with missing
+        # values, then correct totals that disagree with Quantity * PriceperUnit
+        with instrument("duckdb_load", files=len(self.sources)) as step:
+            self.query(f"""
+                CREATE TABLE sales AS
+                SELECT {select}
+                FROM (SELECT DISTINCT * REPLACE (try_strptime(Date, {sql_literal(DataIngestionModule.DATE_FORMAT)})
+                                                 AS Date)
+                      FROM raw_sales)
+                WHERE COLUMNS(*) IS NOT NULL
+            """)
+            step["rows_out"] = int(self.query("SELECT count(*) AS n FROM sales")["n"].iloc[0])
+        logging.info(f"Loaded {step['rows_out']} processed rows into DuckDB from {len(self.sources)} file(s).")
+        return self._column_types("sales")
+
+    def _column_types(self, relation) -> dict:
+        described = self.query(f"DESCRIBE {relation}")
+        return dict(zip(described["column_name"], described["column_type"]))
+
+    def _sum(self, column) -> str:
+        """SQL sum keeping integer columns integer, as pandas does, instead of widening to HUGEINT"""
+        integer = self.sales()[column] in ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "UTINYINT", "USMALLINT",
+                                          "UINTEGER", "UBIGINT", "HUGEINT")
+        return f"CAST(sum({column}) AS {'BIGINT' if integer else 'DOUBLE'})"
+
+    @staticmethod
+    def _categorical(values: pd.Series) -> pd.Categorical:
+        return pd.Categorical(values, categories=sorted(values.unique()))
+
+    def row_count(self) -> int:
+        """Processed rows, known once the cube is built; None before so stage records do not force a scan"""
+        cube = self._intermediates.get("cube")
+        return None if cube is None else int(cube.grand_total("Transactions"))
+
+    def headline_totals(self):
+        cube = self.cube()
+        return cube.grand_total("TotalPrice"), cube.grand_total("Transactions")
+
+    def cube(self):
+        return self.intermediate("cube", self._query_cube)
+
+    def _query_cube(self) -> SalesCube:
+        cells = self.query(f"""
+            SELECT ProductName, Region, strftime(Date, '%Y-%m') AS Month, dayname(Date) AS Weekday,
+                   {self._sum("Quantity")} AS Quantity, {self._sum("TotalPrice")} AS TotalPrice,
+                   count(TransactionID) AS Transactions
+            FROM sales GROUP BY ALL
+        """)
+        cells["ProductName"] = self._categorical(cells["ProductName"])
+        cells["Region"] = self._categorical(cells["Region"])
+        cells["Month"] = pd.PeriodIndex(cells["Month"], freq="M")
+        cells["Weekday"] = cells["Weekday"].astype(str)
+        # Ordered like the cells of a pandas groupby over the same keys
+        cells = cells.sort_values(SalesCube.DIMENSIONS, kind="stable", ignore_index=True)
+        return SalesCube(cells)
+
+    def customer_summary(self) -> dict:
+        """Materialize per-customer totals once as the customers table; returns its row count and the
+        CustomerID dtype the pandas backend would give them, so no per-customer data is read into pandas"""
+        return self.intermediate("customer_summary", self._create_customers)
+
+    def _create_customers(self) -> dict:
+        self.query(f"""
+            CREATE OR REPLACE TABLE customers AS
+            SELECT CustomerID, {self._sum("TotalPrice")} AS TotalSpend, avg(TotalPrice) AS AveragePurchase,
+                   count(TotalPrice) AS PurchaseCount, max(Date) AS LastPurchase
+            FROM sales GROUP BY CustomerID
+        """)
+        bounds = self.query("SELECT count(*) AS n, min(CustomerID) AS lo, max(CustomerID) AS hi FROM customers")
+        # Downcast as at ingestion, over the whole column, so indexes match the pandas backend's
+        ids = pd.to_numeric(bounds[["lo", "hi"]].iloc[0].dropna().astype("int64"), downcast="integer")
+        return {"customers": int(bounds["n"].iloc[0]), "id_dtype": ids.dtype}
+
+    def _customer_index(self, frame: pd.DataFrame) -> pd.DataFrame:
+        return frame.astype({"CustomerID": self.customer_summary()["id_dtype"]}).set_index("CustomerID")
+
+    def top_customers(self, column, name, n=10):
+        self.customer_summary()
+        # Ties go to the lower CustomerID, as nlargest over the summary sorted by CustomerID does
+        top = self.query(f"SELECT CustomerID, {column} FROM customers ORDER BY {column} DESC, CustomerID LIMIT {n}")
+        return self._customer_index(top)[column].rename(name)
+
+    def distinct_customers_analysis(self):
+        """Counting the distinct customers"""
+        return pd.Series([self.customer_summary()["customers"]], index=["Distinct Customers"], name="CustomerID")
+
+    def purchase_value_counts(self) -> dict:
+        """Quantiles are queried from the sales table directly, so this only makes sure it exists"""
+        return self.sales()
+
+    def purchase_value_quantiles_analysis(self):
+        """Analyzing the distribution of purchase values by quantile"""
+        self.purchase_value_counts()
+        # quantile_cont interpolates linearly between the nearest ranks, as Series.quantile does
+        values = self.query(f"SELECT quantile_cont(TotalPrice, {self.PURCHASE_QUANTILES}) AS q FROM sales")["q"].iloc[0]
+        quantiles = pd.Index(self.PURCHASE_QUANTILES, name="Quantile")
+        # NULL when there are no sales, which quantiles_from_counts() answers with NaN
+        values = values if isinstance(values, (list, np.ndarray)) else np.nan
+        return pd.Series(values, index=quantiles, name="TotalPrice", dtype="float64")
+
+    def rfm(self) -> dict:
+        """Score every customer by quintile as rfm_table() does, into the rfm table; returns the customer count"""
+        return self.intermediate("rfm", self._create_rfm)
+
+    def _create_rfm(self) -> dict:
+        summary = self.customer_summary()
+        edges = [q / 5 for q in range(1, 5)]
+        # A value's score is 1 plus the number of quintile edges below it, like searchsorted(side="left")
+        score = lambda column: "1 + " + " + ".join(
+            f"CAST(c.{column} > edges.{column}[{position + 1}] AS INTEGER)" for position in range(len(edges)))
+        grid = ", ".join(f"({r + 1}, {fm + 1}, {SEGMENTS.index(segment)})"
+                         for r, row in enumerate(SEGMENT_GRID) for fm, segment in enumerate(row))
+        self.query(f"""
+            CREATE OR REPLACE TABLE rfm AS
+            WITH scored AS (
+                SELECT CustomerID, LastPurchase, PurchaseCount, TotalSpend,
+                       {score("recency")} AS R, {score("frequency")} AS F, {score("monetary")} AS M
+                FROM (SELECT *, epoch(LastPurchase) AS recency, PurchaseCount AS frequency,
+                             TotalSpend AS monetary FROM customers) c,
+                     (SELECT quantile_cont(epoch(LastPurchase), {edges}) AS recency,
+                             quantile_cont(PurchaseCount, {edges}) AS frequency,
+                             quantile_cont(TotalSpend, {edges}) AS monetary FROM customers) edges
+            )
+            SELECT CustomerID,
+                   date_diff('day', LastPurchase, (SELECT max(LastPurchase) FROM customers) + INTERVAL 1 DAY)
+                       AS Recency,
+                   PurchaseCount AS Frequency, TotalSpend AS Monetary, R, F, M, grid.code AS Segment
+            FROM scored JOIN (VALUES {grid}) grid(r_score, fm_score, code)
+                ON grid.r_score = scored.R AND grid.fm_score = (scored.F + scored.M + 1) // 2
+        """)
+        return summary
+
+    def customer_rfm_analysis(self):
+        """Scoring every customer's recency, frequency and monetary value by quintile and assigning a segment.
+
+        The per-customer table is itself the result, so it is read into pandas only when this analysis is."""
+        self.rfm()
+        rfm = self._customer_index(self.query("SELECT * FROM rfm ORDER BY CustomerID"))
+        return rfm.astype({"Recency": "int64", "Frequency": "int64", "Monetary": "float64",
+                           "R": "int8", "F": "int8", "M": "int8"}).assign(
+            Segment=lambda frame: pd.Categorical.from_codes(frame["Segment"].to_numpy(), SEGMENTS))
+
+    def rfm_segments_analysis(self):
+        """Analyzing how customers and spend are distributed across RFM segments"""
+        self.rfm()
+        summary = self.query("""
+            SELECT Segment, count(*) AS Customers, avg(Recency) AS AverageRecency,
+                   avg(Frequency) AS AverageFrequency, sum(Monetary) AS TotalSpend
+            FROM rfm GROUP BY Segment
+        """).set_index("Segment").reindex(range(len(SEGMENTS)))
+        summary.index = pd.CategoricalIndex(SEGMENTS, categories=SEGMENTS, name="Segment")
+        summary["Customers"] = summary["Customers"].fillna(0).astype("int64")
+        summary["TotalSpend"] = summary["TotalSpend"].fillna(0.0).astype("float64")
+        summary.insert(1, "Share", summary["Customers"] / max(int(summary["Customers"].sum()), 1))
+        return summary
+
+    def pair_engine(self):
+        return self.intermediate("pair_engine", self._query_pair_counts)
+
+    def _query_pair_counts(self):
+        """Baskets holding each product pair, from a self-join of the distinct (customer, product) baskets"""
+        self.sales()
+        counts = self.query("""
+            CREATE OR REPLACE TEMP TABLE baskets AS SELECT DISTINCT CustomerID, ProductName FROM sales;
+            WITH items AS (SELECT ProductName, count(*) AS baskets FROM baskets GROUP BY ProductName),
+                 pairs AS (SELECT a.ProductName AS first, b.ProductName AS second, count(*) AS frequency
+                           FROM baskets a JOIN baskets b
+                             ON a.CustomerID = b.CustomerID AND a.ProductName < b.ProductName
+                           GROUP BY ALL)
+            SELECT pairs.*, f.baskets AS count_first, s.baskets AS count_second,
+                   (SELECT count(DISTINCT CustomerID) FROM baskets) AS n_baskets
+            FROM pairs JOIN items f ON pairs.first = f.ProductName JOIN items s ON pairs.second = s.ProductName
+        """)
+        return DuckDBPairCounts(counts)
+
+    def top_product_pairs_analysis(self, top_n=10, basket_key="CustomerID", **thresholds):
+        if basket_key != "CustomerID":
+            raise ValueError("The duckdb backend counts pairs per customer basket only")
+        return super().top_product_pairs_analysis(top_n, basket_key, **thresholds)
+
+    def rows(self):
+        raise ValueError(ROW_LEVEL_ONLY)
+
+    def append(self, batch, batch_id=None):
+        raise ValueError(ROW_LEVEL_ONLY)
+
+
+# Pair counts queried by DuckDBAnalysisModule, ranked like ProductPairEngine.pairs()
+class DuckDBPairCounts:
+    def __init__(self, counts: pd.DataFrame):
+        self.counts = counts
+
+    def pairs(self, top_n=10, min_support=0.0, min_confidence=0.0, min_lift=0.0) -> pd.DataFrame:
+        counts = self.counts
+        n_baskets = int(counts["n_baskets"].iloc[0]) if len(counts) else 0
+        return pair_table(counts["first"].to_numpy(), counts["second"].to_numpy(), counts["frequency"].to_numpy(),
+                          counts["count_first"].to_numpy(), counts["count_second"].to_numpy(), n_baskets,
+                          top_n, min_support, min_confidence, min_lift)
+
+    def __len__(self):
+        return len(self.counts)
+
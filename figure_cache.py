@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from pipeline_cache import derives_from
+from profiling import instrument
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("DASHBOARD_FIGURE_CACHE_MB", 64)) * 1024 ** 2)
+
+
+# Serialized Plotly figures keyed by (dataset, view, chart) and shared by every session, so a rerun
+# re-emits a figure instead of rebuilding it with plotly express
+class FigureCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Figures are kept as JSON specs; beyond max_bytes the least recently used are evicted"""
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def figure(self, dataset_key, view, name, build):
+        """The cached figure for the chart, calling build() for a new one on a miss.
+
+        view identifies what the chart was computed over, e.g. the (filter, approximate) pair."""
+        key = (dataset_key, view, name)
+        with self._lock:
+            spec = self._entries.get(key)
+            if spec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if spec is None:
+            with instrument("figure", cache="miss", figure=name):
+                spec = build().to_json()
+            self.put(key, spec)
+        from plotly.graph_objects import Figure
+
+        # The spec came from a validated figure, so it is loaded without validating it again
+        return Figure(json.loads(spec), _validate=False)
+
+    def put(self, key, spec: str):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= len(previous)
+            self._entries[key] = spec
+            self._nbytes += len(spec)
+            while len(self._entries) > 1 and self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def invalidate(self, dataset_key) -> int:
+        """Drop every figure of a dataset, including those with appended batches, e.g. when it is evicted"""
+        with self._lock:
+            stale = [key for key in self._entries if derives_from(key[0], dataset_key)]
+            for key in stale:
+                self._nbytes -= len(self._entries.pop(key))
+        if stale:
+            logging.info(f"Dropped {len(stale)} cached figures of dataset {dataset_key}.")
+        return len(stale)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,19 +1,22 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import logging
-from abc import ABC, abstractmethod
-from typing import Type
-from collections import Counter
-from itertools import combinations
-import matplotlib.pyplot as plt
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pipeline
+from columnar_cache import ColumnarCache
+from downsampling import TABLE_PAGE_SIZE, lttb, page_count, paginate, top_n_with_other
+from dataset_store import DatasetStore
+from duckdb_backend import DEFAULT_BACKEND, DuckDBAnalysisModule
+from figure_cache import FigureCache
+from pipeline import (ANALYSES, AnalysisResults, DataAnalysisModule, DataIngestionModule, DataProcessingModule,
+                      SalesFilter, required_columns)
+from pipeline_cache import PipelineCache, appended_key, cache_key, content_hash
+from profiling import instrument, stage_log
 
 # Streamlit App Styling
-st.set_page_config(page_title="Supermarket Sales Dashboard", page_icon="📊", layout="wide")
-st.markdown("""
+PAGE_STYLE = """
     <style>
     /* Importing Modern Font */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600&display=swap');
@@ -91,170 +94,118 @@ st.markdown("""
         visibility: hidden;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
 
 
+def configure_page():
+    """Logging, error display, page config and styling, applied once by the script Streamlit runs rather than on import"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Pipeline errors are shown in the dashboard as well as logged
+    pipeline.set_error_handler(st.error)
+    st.set_page_config(page_title="Supermarket Sales Dashboard", page_icon="📊", layout="wide")
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
 
 
-# Data Ingestion Module (Factory Pattern)
-class DataIngestionModule:
-    @staticmethod
-    def load_data(file):
-        try:
-            df = pd.read_csv(file)
-            logging.info("Data successfully ingested.")
-            return df
-        except Exception as e:
-            logging.error(f"Data ingestion failed: {str(e)}")
-            st.error(f"Error loading data: {str(e)}")
-            return pd.DataFrame()
-
-
-# Data Processing Module
-class DataProcessingModule:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df
-
-    def process_data(self):
-        try:
-            self.df["Date"] = pd.to_datetime(self.df["Date"], format='%m/%d/%Y', errors='coerce')
-            self.df.drop_duplicates(inplace=True)
-            self.df.dropna(inplace=True)
-            self.df["TotalPrice"] = self.df["Quantity"] * self.df["PriceperUnit"]
-            logging.info("Data processed successfully.")
-            return self.df
-        except Exception as e:
-            logging.error(f"Data processing error: {str(e)}")
-            st.error(f"Data processing error: {str(e)}")
-            return pd.DataFrame()
-
-
-# Singleton Pattern for Data Storage Module
-class DataStorageModule:
-    _instance = None
-
-    def __new__(cls, df: pd.DataFrame):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.df = df
-        return cls._instance
-
-
-# Observer Pattern for Data Analysis
-class Observer(ABC):
-    @abstractmethod
-    def update(self, data):
-        pass
-
-
-class DataAnalysisModule(Observer):
-    def __init__(self, df):
-        self.df = df
-
-    def update(self, df):
-        self.df = df
-
-    def analyze(self):
-        try:
-            return {
-                "best_selling_products": self.df.groupby("ProductName")["Quantity"].sum().sort_values(
-                    ascending=False).head(10),
-                "monthly_sales": self.df.groupby(self.df["Date"].dt.to_period("M"))["TotalPrice"].sum(),
-                "regional_sales": self.df.groupby("Region")["TotalPrice"].sum().sort_values(ascending=False),
-                "sales_by_day": self.df.groupby(self.df["Date"].dt.day_name())["TotalPrice"].sum().sort_values(
-                    ascending=False),
-                "frequent_customers": self.frequent_customers_analysis(),
-                "average_purchase_value": self.average_purchase_value_analysis(),
-                "customer_recency": self.customer_recency_analysis(),
-                "customer_purchase_frequency": self.customer_purchase_frequency_analysis(),
-                "top_product_pairs": self.top_product_pairs_analysis()
-            }
-        except Exception as e:
-            logging.error(f"Error in data analysis: {str(e)}")
-            st.error(f"Error in data analysis: {str(e)}")
-            return {}
-
-    def frequent_customers_analysis(self):
-        """Analyzing frequent customers by total amount spent"""
-        return self.df.groupby("CustomerID")["TotalPrice"].sum().sort_values(ascending=False).head(10)
-
-    def average_purchase_value_analysis(self):
-        """Analyzing the average purchase value per customer"""
-        return self.df.groupby("CustomerID")["TotalPrice"].mean().sort_values(ascending=False).head(10)
-
-    def customer_recency_analysis(self):
-        """Analyzing customer recency by the date of their last purchase"""
-        return self.df.groupby("CustomerID")["Date"].max().sort_values(ascending=False).head(10)
-
-    def customer_purchase_frequency_analysis(self):
-        """Analyzing how frequently each customer makes a purchase"""
-        return self.df.groupby("CustomerID")["TransactionID"].count().sort_values(ascending=False).head(10)
-
-    from itertools import combinations
-    from collections import Counter
-
-    from itertools import combinations
-    from collections import Counter
-
-    def top_product_pairs_analysis(self):
-        try:
-            customer_products = self.df.groupby("CustomerID")["ProductName"].apply(list)
-            pair_counter = Counter()
-
-            for products in customer_products:
-                pairs = combinations(sorted(set(products)), 2)
-                pair_counter.update(pairs)
-
-            pair_df = pd.DataFrame(pair_counter.items(), columns=["Product Pair", "Frequency"])
-            pair_df = pair_df.sort_values(by="Frequency", ascending=False).head(10)
-            pair_df["Label"] = pair_df["Product Pair"].apply(lambda x: f"{x[0]} & {x[1]}")
-            return pair_df
-        except Exception as e:
-            logging.error(f"Error in product pair analysis: {str(e)}")
-            st.error(f"Error in product pair analysis: {str(e)}")
-            return pd.DataFrame()
+def plotly_express():
+    """plotly.express, imported when the first chart is built since it is the slowest import of the app"""
+    import plotly.express as px
+    return px
 
 
 # User Interface Module
 class UserInterfaceModule:
-    def __init__(self, processed_data: dict):
+    def __init__(self, processed_data: AnalysisResults, figure_cache: FigureCache = None, dataset_key=None, view=None):
+        """With a figure_cache, Plotly figures are built once per dataset_key, view and chart"""
         self.processed_data = processed_data
+        self.figure_cache = figure_cache
+        self.dataset_key = dataset_key
+        self.view = view
+
+    def plotly_chart(self, name, build):
+        """Emit the figure build(px) returns, or the cached one it returned on an earlier run"""
+        build_figure = lambda: build(plotly_express())
+        fig = build_figure() if self.figure_cache is None else \
+            self.figure_cache.figure(self.dataset_key, self.view, name, build_figure)
+        st.plotly_chart(fig, use_container_width=True)
+
+    @staticmethod
+    def label_if_approximate(result):
+        """Mark results answered from sketches, with their documented error bound"""
+        approximate = getattr(result, "attrs", {}).get("approximate")
+        if approximate:
+            st.caption(f"≈ Approximate ({approximate['method']}): {approximate['description']}")
+
+    def wait_for(self, *names):
+        """Show progress while background jobs finish the results a page needs"""
+        pending = [name for name in names if not self.processed_data.is_computed(name)]
+        if not pending:
+            return
+        progress = st.progress(0.0, text="⏳ Preparing analysis...")
+        for done, name in enumerate(pending, start=1):
+            self.processed_data[name]
+            progress.progress(done / len(pending), text=f"⏳ Preparing analysis... ({done}/{len(pending)})")
+        progress.empty()
+
+    @staticmethod
+    def display_table(frame, key):
+        """Send one page of a table to the browser instead of the whole frame"""
+        if len(frame) <= TABLE_PAGE_SIZE:
+            st.dataframe(frame, use_container_width=True)
+            return
+        pages = page_count(len(frame))
+        page = st.number_input(f"Page (1-{pages})", min_value=1, max_value=pages, value=1, key=key)
+        rows = paginate(frame, page)
+        first = (page - 1) * TABLE_PAGE_SIZE
+        st.caption(f"Showing rows {first + 1:,}-{first + len(rows):,} of {len(frame):,}")
+        st.dataframe(rows, use_container_width=True)
 
     def display_best_selling_products(self):
         st.subheader("🏆 Best-Selling Products")
+        self.wait_for("best_selling_products")
         products = self.processed_data["best_selling_products"]
-        fig = px.bar(products, x=products.index, y=products.values, color=products.values,
-                     labels={'x': 'Product', 'y': 'Quantity Sold'}, title="Top 10 Best-Selling Products")
-        st.plotly_chart(fig, use_container_width=True)
+        self.plotly_chart("best_selling_products", lambda px: px.bar(
+            products, x=products.index, y=products.values, color=products.values,
+            labels={'x': 'Product', 'y': 'Quantity Sold'}, title="Top 10 Best-Selling Products"))
+        self.label_if_approximate(products)
 
     def display_monthly_sales(self):
         st.subheader("📈 Monthly Sales Trend")
-        monthly_sales = self.processed_data["monthly_sales"]
-        fig = px.line(monthly_sales, x=monthly_sales.index.astype(str), y=monthly_sales.values, markers=True,
-                      labels={'x': 'Month', 'y': 'Total Sales'}, title="Monthly Sales Over Time")
-        st.plotly_chart(fig, use_container_width=True)
+        self.wait_for("monthly_sales")
+        monthly_sales = lttb(self.processed_data["monthly_sales"])
+        self.plotly_chart("monthly_sales", lambda px: px.line(
+            monthly_sales, x=monthly_sales.index.astype(str), y=monthly_sales.values, markers=True,
+            labels={'x': 'Month', 'y': 'Total Sales'}, title="Monthly Sales Over Time"))
 
     def display_regional_sales(self):
         st.subheader("📍 Regional Sales Analysis")
-        regional_sales = self.processed_data["regional_sales"]
-        fig = px.bar(regional_sales, x=regional_sales.index, y=regional_sales.values, color=regional_sales.values,
-                     labels={'x': 'Region', 'y': 'Total Sales'}, title="Total Sales Per Region")
-        st.plotly_chart(fig, use_container_width=True)
+        self.wait_for("regional_sales")
+        regional_sales = top_n_with_other(self.processed_data["regional_sales"])
+        self.plotly_chart("regional_sales", lambda px: px.bar(
+            regional_sales, x=regional_sales.index, y=regional_sales.values, color=regional_sales.values,
+            labels={'x': 'Region', 'y': 'Total Sales'}, title="Total Sales Per Region"))
 
     def display_sales_by_day_of_week(self):
         st.subheader("📅 Sales by Day of the Week")
+        self.wait_for("sales_by_day")
         sales_by_day = self.processed_data["sales_by_day"]
-        fig = px.bar(sales_by_day, x=sales_by_day.index, y=sales_by_day.values, color=sales_by_day.values,
-                     labels={'x': 'Day', 'y': 'Total Sales'}, title="Sales Performance by Day of the Week")
-        st.plotly_chart(fig, use_container_width=True)
+        self.plotly_chart("sales_by_day", lambda px: px.bar(
+            sales_by_day, x=sales_by_day.index, y=sales_by_day.values, color=sales_by_day.values,
+            labels={'x': 'Day', 'y': 'Total Sales'}, title="Sales Performance by Day of the Week"))
 
     def display_customer_behavior(self):
         st.subheader("👤 Customer Behavior Analysis")
+        self.wait_for("distinct_customers", "frequent_customers", "average_purchase_value", "customer_recency",
+                      "customer_purchase_frequency", "purchase_value_quantiles", "rfm_segments")
+
+        distinct_customers = self.processed_data["distinct_customers"]
+        st.metric("👥 Distinct Customers", f"{distinct_customers.iloc[0]:,}")
+        self.label_if_approximate(distinct_customers)
 
         # Display Top 10 Frequent Customers by Total Spend
         st.write("### 🔝 Top 10 Frequent Customers (Total Spend)")
         frequent_customers = self.processed_data["frequent_customers"]
         st.bar_chart(frequent_customers)
+        self.label_if_approximate(frequent_customers)
 
         # Display Average Purchase Value per Customer
         st.write("### 💳 Average Purchase Value per Customer")
@@ -264,30 +215,46 @@ class UserInterfaceModule:
         # Display Customer Recency (Last Purchase Date)
         st.write("### ⏳ Customer Recency (Last Purchase Date)")
         recency = self.processed_data["customer_recency"]
-        st.dataframe(recency)
+        self.display_table(recency, "recency_page")
 
         # Display Customer Purchase Frequency
         st.write("### 🔄 Customer Purchase Frequency")
         purchase_frequency = self.processed_data["customer_purchase_frequency"]
         st.bar_chart(purchase_frequency)
+        self.label_if_approximate(purchase_frequency)
+
+        # Display Purchase Value Distribution
+        st.write("### 💵 Purchase Value Quantiles")
+        quantiles = self.processed_data["purchase_value_quantiles"]
+        st.dataframe(quantiles.rename(index=lambda q: f"{q:.0%}"), use_container_width=True)
+        self.label_if_approximate(quantiles)
+
+        self.display_rfm_segments()
+
+    def display_rfm_segments(self):
+        st.write("### 🧭 RFM Segments")
+        segments = self.processed_data["rfm_segments"]
+        self.plotly_chart("rfm_segments", lambda px: px.bar(
+            segments, x=segments.index, y="Customers", color="TotalSpend",
+            labels={'x': 'Segment', 'TotalSpend': 'Total Spend'}, title="Customers per RFM Segment"))
+        st.dataframe(segments.style.format({"Share": "{:.1%}", "AverageRecency": "{:.0f} days",
+                                            "AverageFrequency": "{:.1f}", "TotalSpend": "${:,.2f}"}),
+                     use_container_width=True)
+
+        # Customers of one segment, a page at a time
+        segment = st.selectbox("Show customers in segment", list(segments.index[segments["Customers"] > 0]))
+        if segment is not None:
+            rfm = self.processed_data["customer_rfm"]
+            self.display_table(rfm[rfm["Segment"] == segment].drop(columns="Segment"), "rfm_page")
 
     def display_product_search(self):
         st.subheader("🔎 Product Search and Analysis")
-        filtered_df = self.processed_data['full_data']
+        self.wait_for("product_search_index")
+        search_index = self.processed_data["product_search_index"]
 
         # 🛍️ Display full product list
         st.markdown("### 📋 Available Products")
-        product_table = (
-            filtered_df.groupby("ProductName")
-            .agg(
-                Total_Quantity=("Quantity", "sum"),
-                Total_Sales=("TotalPrice", "sum"),
-                Transactions=("TransactionID", "count")
-            )
-            .sort_values("Total_Sales", ascending=False)
-            .reset_index()
-        )
-        st.dataframe(product_table, use_container_width=True)
+        self.display_table(search_index.product_table, "product_table_page")
 
         # 🔍 Search input
         st.markdown("---")
@@ -298,40 +265,34 @@ class UserInterfaceModule:
             st.info("Please enter a product name to search.")
             return
 
-        matching_products = filtered_df[
-            filtered_df['ProductName'].str.contains(search_term, case=False, na=False)
-        ]
+        matching_products = search_index.search(search_term)
 
-        if matching_products.empty:
+        if not matching_products:
             st.warning("No matching products found.")
             return
 
-        st.success(f"Found {matching_products['ProductName'].nunique()} matching product(s).")
+        st.success(f"Found {len(matching_products)} matching product(s).")
 
         # 💰 Total sales and quantity
-        total_sales = matching_products['TotalPrice'].sum()
-        total_quantity = matching_products['Quantity'].sum()
+        total_sales, total_quantity = search_index.totals(matching_products)
         st.metric("💰 Total Sales", f"${total_sales:,.2f}")
         st.metric("📦 Total Quantity Sold", f"{total_quantity:,}")
 
         # 📍 Regional breakdown
         st.write("### 📍 Regional Breakdown")
-        region_data = matching_products.groupby("Region")["TotalPrice"].sum().sort_values(ascending=False)
-        st.bar_chart(region_data)
+        st.bar_chart(top_n_with_other(search_index.regional(matching_products)))
 
         # 📅 Monthly trend
         st.write("### 📅 Monthly Sales Trend")
-        monthly_data = matching_products.groupby(
-            matching_products["Date"].dt.to_period("M")
-        )["TotalPrice"].sum()
-        st.line_chart(monthly_data)
+        st.line_chart(lttb(search_index.monthly(matching_products)))
 
     def display_top_product_pairs(self):
         st.subheader("🛒 Most Frequent Product Pairs")
+        self.wait_for("top_product_pairs")
         pair_df = self.processed_data["top_product_pairs"]
 
         if not pair_df.empty:
-            fig = px.bar(
+            self.plotly_chart("top_product_pairs", lambda px: px.bar(
                 pair_df,
                 x="Frequency",
                 y="Label",
@@ -339,36 +300,274 @@ class UserInterfaceModule:
                 color="Frequency",
                 title="Top 10 Product Pairs Bought Together",
                 labels={"Label": "Product Pair", "Frequency": "Times Bought Together"}
-            )
-            fig.update_layout(yaxis={'categoryorder': 'total ascending'})
-            st.plotly_chart(fig, use_container_width=True)
+            ).update_layout(yaxis={'categoryorder': 'total ascending'}))
+            self.label_if_approximate(pair_df)
         else:
             st.info("No product pair data available.")
 
+    def display_diagnostics(self, records, cache):
+        st.subheader("🩺 Pipeline Diagnostics")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Pipeline Cache Hits", f"{cache.hits:,}")
+        col2.metric("Pipeline Cache Misses", f"{cache.misses:,}")
+        col3.metric("Cached Pipelines", f"{len(cache):,}")
+        if self.figure_cache is not None:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Figure Cache Hits", f"{self.figure_cache.hits:,}")
+            col2.metric("Figure Cache Misses", f"{self.figure_cache.misses:,}")
+            col3.metric("Cached Figures", f"{len(self.figure_cache):,} ({self.figure_cache.total_bytes / 1024 ** 2:.1f} MB)")
+
+        if not records:
+            st.info("No pipeline stages recorded yet.")
+            return
+        stages = pd.DataFrame(records)
+        stages["timestamp"] = pd.to_datetime(stages["timestamp"], unit="s")
+        fig = plotly_express().bar(stages.groupby("stage")["seconds"].sum().sort_values().reset_index(),
+                                   x="seconds", y="stage", orientation="h", title="Wall Time by Stage (recent runs)")
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(stages.iloc[::-1], use_container_width=True)
+
+
+@st.cache_resource
+def get_pipeline_cache():
+    """Process-wide pipeline cache that survives Streamlit reruns"""
+    return PipelineCache()
+
+
+@st.cache_resource
+def get_columnar_cache():
+    """On-disk cache of processed frames, reused by later sessions and workers"""
+    return ColumnarCache()
+
+
+@st.cache_resource
+def get_figure_cache():
+    """Serialized Plotly figures shared by all sessions, dropped with their dataset"""
+    return FigureCache()
+
+
+@st.cache_resource
+def get_dataset_store():
+    """Processed frames shared by all sessions, spilled to the columnar cache when evicted"""
+    store = DatasetStore(spill_cache=get_columnar_cache(), columns=SupermarketSalesApp.DASHBOARD_COLUMNS)
+    # Cached analyses hold the frame, so they go when it is evicted
+    store.evict_listeners.append(get_pipeline_cache().invalidate)
+    store.evict_listeners.append(get_figure_cache().invalidate)
+    return store
+
+
+@st.cache_resource
+def get_analysis_executor():
+    """Thread pool computing analyses in the background, shared by all sessions"""
+    return ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="analysis")
+
+
+def session_dataset(store, key, loader, on_superseded=None):
+    """This session's handle on the dataset for key, releasing the one it held for a previous upload.
+
+    on_superseded(old_key) is called when no session references the previous dataset any more."""
+    handle = st.session_state.get("dataset_handle")
+    if handle is None or handle.key != key:
+        if handle is not None:
+            handle.release()
+            if on_superseded is not None and store.refcount(handle.key) == 0:
+                on_superseded(handle.key)
+        with st.spinner("📥 Loading dataset..."):
+            handle = st.session_state["dataset_handle"] = store.acquire(key, loader)
+    return handle
+
 
 # Main Application
 class SupermarketSalesApp:
-    def __init__(self, file):
-        # Data Pipeline
-        raw_data = DataIngestionModule.load_data(file)
-        processed_data = DataProcessingModule(raw_data).process_data()
-        storage = DataStorageModule(processed_data)
+    # Columns the registered analyses and the sidebar filters declare; PriceperUnit and ProductID are read
+    # for cleaning only and dropped once the rows are processed
+    DASHBOARD_COLUMNS = required_columns(list(ANALYSES) + ["date_index"])
+    # Background computation order: cube-backed pages first, the costly pair analysis last
+    PREFETCH_ORDER = [
+        "sales_cube", "best_selling_products", "monthly_sales", "regional_sales", "sales_by_day",
+        "product_search_index", "distinct_customers", "frequent_customers", "average_purchase_value",
+        "customer_recency", "customer_purchase_frequency", "purchase_value_quantiles", "rfm_segments",
+        "top_product_pairs",
+    ]
+    # Results each page shows; filtered and approximate views compute only the active page's ahead
+    PAGE_RESULTS = {
+        "Product Search": ["product_search_index"],
+        "Best Products": ["best_selling_products"],
+        "Sales Trends": ["monthly_sales"],
+        "Regional Sales": ["regional_sales"],
+        "Day Analysis": ["sales_by_day"],
+        "Customer Behavior": ["distinct_customers", "frequent_customers", "average_purchase_value",
+                              "customer_recency", "customer_purchase_frequency", "purchase_value_quantiles",
+                              "rfm_segments"],
+        "Pair Product Analysis": ["top_product_pairs"],
+    }
 
-        # Analysis
-        self.analysis = DataAnalysisModule(storage.df)
-        self.processed_data = self.analysis.analyze()
-        self.processed_data["full_data"] = storage.df
+    def __init__(self, file, backend=DEFAULT_BACKEND):
+        # Reruns on the same upload reuse the cached pipeline output
+        self.cache = get_pipeline_cache()
+        self.columnar_cache = get_columnar_cache()
+        self.store = get_dataset_store()
+        self.figure_cache = get_figure_cache()
+        self.executor = get_analysis_executor()
+        self.backend = backend
+        self.cache_key = cache_key(file)
+        if backend == "duckdb":
+            # Out-of-core: the upload is queried on disk, so no session holds its rows in memory
+            self.dataset = None
+            build = lambda: self.build_duckdb_pipeline(file, self.executor, self.remeasure_callback(self.cache_key))
+        else:
+            self.dataset = session_dataset(self.store, self.cache_key,
+                                           lambda: self.load_dataset(file, self.cache_key, self.columnar_cache),
+                                           on_superseded=self.cancel_jobs)
+            build = lambda: self.build_pipeline(self.dataset.df, self.executor,
+                                                self.remeasure_callback(self.cache_key))
+        with instrument("pipeline_cache") as step:
+            cached = self.cache.get(self.cache_key)
+            step["cache"] = "miss" if cached is None else "hit"
+        if cached is None:
+            cached = self.cache.put(self.cache_key, build())
+        else:
+            logging.info("Reusing cached pipeline results.")
+        self.analysis, self.processed_data = cached
+        # Key of the cached entry shown, which becomes the base key plus batch ids once batches are appended
+        self.results_key = self.cache_key
 
         # UI
-        self.ui_module = UserInterfaceModule(self.processed_data)
+        self.ui_module = UserInterfaceModule(self.processed_data, self.figure_cache, self.results_key,
+                                             (SalesFilter(), False))
+
+    @staticmethod
+    def load_dataset(file, key, columnar_cache):
+        # Data Pipeline, only run when neither the dataset store nor the columnar cache holds the upload
+        columns = SupermarketSalesApp.DASHBOARD_COLUMNS
+        raw_data = DataIngestionModule.load_data(file, columns + [column for column in DataProcessingModule.COLUMNS
+                                                                  if column not in columns])
+        processed_data = DataProcessingModule(raw_data).process_data()
+        # Stored sorted by Date so sidebar date filters are slices of the frame
+        processed_data = processed_data[SupermarketSalesApp.DASHBOARD_COLUMNS].sort_values(
+            "Date", kind="stable", ignore_index=True)
+        columnar_cache.save(key, processed_data)
+        return processed_data
+
+    def remeasure_callback(self, key):
+        """on_result callback keeping the cache entry's size current as results and views are computed"""
+        cache = self.cache
+        return lambda name: cache.remeasure(key)
+
+    @staticmethod
+    def build_pipeline(df, executor, on_result=None):
+        # Analysis runs in the background; pages wait only for the results they show
+        analysis = DataAnalysisModule(df)
+        analysis.on_result = on_result
+        results = analysis.analyze()
+        results.prefetch(executor, SupermarketSalesApp.PREFETCH_ORDER)
+        return analysis, results
+
+    @staticmethod
+    def build_duckdb_pipeline(file, executor, on_result=None):
+        """Analyse a path in place, or an upload spooled into the database's own directory, with the DuckDB backend"""
+        if isinstance(file, (str, os.PathLike)):
+            analysis = DuckDBAnalysisModule(file)
+        else:
+            analysis = DuckDBAnalysisModule.from_upload(file)
+        analysis.on_result = on_result
+        results = analysis.analyze()
+        results.prefetch(executor, SupermarketSalesApp.PREFETCH_ORDER)
+        return analysis, results
+
+    def cancel_jobs(self, key):
+        """Cancel queued analyses of a dataset that no session is looking at any more"""
+        cached = self.cache.peek(key)
+        if cached is not None:
+            cancelled = cached[1].cancel()
+            logging.info(f"Cancelled {cancelled} background analyses of superseded dataset {key}.")
+
+    def append_batches(self, files):
+        """Show the upload with this session's delta files folded in, in upload order.
+
+        Each prefix of the batches is cached under the base key plus its batch ids, so sessions share
+        only states built from the same batches, and each state is a copy of the previous one with one
+        batch appended, leaving the entries of the base upload and of shorter prefixes untouched."""
+        applied = []
+        for file in files:
+            batch_id = content_hash(file)
+            if batch_id in applied:
+                continue
+            key = appended_key(self.cache_key, applied + [batch_id])
+            cached = self.cache.get(key)
+            if cached is None:
+                analysis = self.analysis.copy()
+                # A batch append() rejects, e.g. one missing required columns, is reported and left out
+                if not analysis.append(DataIngestionModule.load_data(file), batch_id=batch_id):
+                    continue
+                analysis.on_result = self.remeasure_callback(key)
+                results = analysis.analyze()
+                results.prefetch(self.executor, self.PREFETCH_ORDER)
+                cached = self.cache.put(key, (analysis, results))
+            applied.append(batch_id)
+            self.analysis, self.processed_data = cached
+            self.results_key = key
+        self.ui_module = UserInterfaceModule(self.processed_data, self.figure_cache, self.results_key,
+                                             (SalesFilter(), False))
+
+    def sidebar_filter(self) -> SalesFilter:
+        """Global date range, region and product filters applied to every page"""
+        index = self.analysis.date_index()
+        if not len(index.days):
+            return SalesFilter()
+        st.sidebar.header("🎛️ Filters")
+        first, last = pd.Timestamp(index.days[0]).date(), pd.Timestamp(index.days[-1]).date()
+        picked = st.sidebar.date_input("📅 Date range", value=(first, last), min_value=first, max_value=last)
+        # While the user is picking, the range has only its first day
+        start, end = (tuple(picked) + (last,))[:2] if isinstance(picked, (list, tuple)) else (picked, last)
+        regions = st.sidebar.multiselect("📍 Regions", list(index.regions))
+        products = st.sidebar.multiselect("🛍️ Products", list(index.products))
+        return SalesFilter(
+            start=pd.Timestamp(start) if start > first else None,
+            end=pd.Timestamp(end) if end < last else None,
+            regions=tuple(sorted(regions)) or None,
+            products=tuple(sorted(products)) or None,
+        )
 
     def run(self):
         st.markdown("<h1 style='text-align: center; color: #2E86C1;'>📊 Supermarket Sales Dashboard</h1>", unsafe_allow_html=True)
         st.sidebar.header("🔍 Navigation")
-        page = st.sidebar.radio("Go to", [
+        pages = [
             "Home","Product Search", "Best Products", "Sales Trends", "Regional Sales",
             "Day Analysis", "Customer Behavior", "Pair Product Analysis"
-        ])
+        ]
+        if st.sidebar.checkbox("🩺 Show Diagnostics"):
+            pages.append("Diagnostics")
+        page = st.sidebar.radio("Go to", pages)
+        # Filters and approximate mode work on row-level data, which the duckdb backend keeps on disk
+        row_level = self.dataset is not None
+        sales_filter = self.sidebar_filter() if row_level else SalesFilter()
+        approximate = row_level and st.sidebar.checkbox("≈ Approximate Mode", help="Answer top-N, distinct-count and quantile "
+                                          "analyses from constant-memory sketches with stated error bounds")
+        if st.sidebar.button("🔄 Recompute Analysis"):
+            self.cache.invalidate(self.cache_key)
+            self.columnar_cache.invalidate(self.cache_key)
+            self.store.invalidate(self.cache_key)
+            self.figure_cache.invalidate(self.cache_key)
+            if self.dataset is not None:
+                self.dataset.release()
+            st.session_state.pop("dataset_handle", None)
+            st.rerun()
+
+        analysis, results = self.analysis, None
+        if not sales_filter.is_empty() or approximate:
+            analysis, results = self.analysis.view(sales_filter, approximate)
+            if page in self.PAGE_RESULTS:
+                results.prefetch(self.executor, self.PAGE_RESULTS[page])
+            self.ui_module = UserInterfaceModule(results, self.figure_cache, self.results_key,
+                                                 (sales_filter, approximate))
+        # Jobs still queued for the view this session showed before would only delay the current one
+        previous = st.session_state.get("view_results")
+        if previous is not None and previous is not results:
+            previous.cancel()
+        st.session_state["view_results"] = results
+        if not sales_filter.is_empty():
+            st.caption(f"🎛️ Filter active: {len(analysis.df):,} of {self.analysis.row_count():,} rows.")
 
         if page == "Home":
 
@@ -376,8 +575,8 @@ class SupermarketSalesApp:
 
             # Display Key Metrics
             col1, col2, col3 = st.columns(3)
-            total_sales = self.analysis.df["TotalPrice"].sum()
-            total_transactions = self.analysis.df.shape[0]
+            # Cheap totals, so Home renders while the analyses are still computing
+            total_sales, total_transactions = analysis.headline_totals()
             avg_sales = total_sales / total_transactions if total_transactions else 0
 
             col1.metric("💰 Total Revenue", f"${total_sales:,.2f}")
@@ -399,12 +598,19 @@ class SupermarketSalesApp:
             self.ui_module.display_customer_behavior()
         elif page == "Pair Product Analysis":
             self.ui_module.display_top_product_pairs()
+        elif page == "Diagnostics":
+            self.ui_module.display_diagnostics(stage_log.records(), self.cache)
 
         st.write("This Application is made by Mohamed Riham - A Software Engineering Student From BCAS CAMPUS")
 
 # Run the app
 if __name__ == "__main__":
+    configure_page()
     uploaded_file = st.sidebar.file_uploader("📂 Upload CSV File", type=["csv"])
     if uploaded_file is not None:
         app = SupermarketSalesApp(uploaded_file)
+        if app.backend == "pandas":
+            batch_files = st.sidebar.file_uploader("➕ Append Daily Batches", type=["csv"], accept_multiple_files=True)
+            if batch_files:
+                app.append_batches(batch_files)
         app.run()
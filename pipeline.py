@@ -0,0 +1,1355 @@
+import glob
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from basket_engine import PAIR_COLUMNS, ProductPairEngine, pair_table
+from profiling import instrument, result_rows
+from sorted_runs import SortedRuns, compact_runs
+from rfm import rfm_table, segment_summary
+from sketches import HeavyHitters, HyperLogLog, TDigest
+
+# Optional callback that surfaces pipeline errors to the user, e.g. st.error in the dashboard
+_error_handler = None
+
+
+def set_error_handler(handler):
+    global _error_handler
+    _error_handler = handler
+
+
+def report_error(log_message, display_message=None):
+    logging.error(log_message)
+    if _error_handler is not None:
+        _error_handler(display_message or log_message)
+
+
+# Data Ingestion Module (Factory Pattern)
+class DataIngestionModule:
+    # Declared schema of the sales CSV, applied at read time instead of pandas' inferred types
+    CATEGORY_COLUMNS = ["ProductName", "Region"]
+    INTEGER_COLUMNS = ["TransactionID", "CustomerID", "ProductID", "Quantity"]
+    FLOAT32_COLUMNS = ["PriceperUnit"]
+    DATE_COLUMN = "Date"
+    DATE_FORMAT = "%m/%d/%Y"
+
+    @staticmethod
+    def read_options(columns=None):
+        """read_csv options; columns limits the read to those columns, skipping any the file lacks"""
+        options = {
+            "dtype": {column: "category" for column in DataIngestionModule.CATEGORY_COLUMNS},
+            "parse_dates": [DataIngestionModule.DATE_COLUMN],
+            "date_format": DataIngestionModule.DATE_FORMAT,
+        }
+        if columns is not None:
+            wanted = set(columns)
+            options["usecols"] = lambda column: column in wanted
+            if DataIngestionModule.DATE_COLUMN not in wanted:
+                del options["parse_dates"], options["date_format"]
+        return options
+
+    @staticmethod
+    def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+        """Downcast IDs and quantities to the smallest integer type and prices to float32 where lossless"""
+        for column in DataIngestionModule.INTEGER_COLUMNS:
+            if column in df and pd.api.types.is_integer_dtype(df[column]):
+                df[column] = pd.to_numeric(df[column], downcast="integer")
+        for column in DataIngestionModule.FLOAT32_COLUMNS:
+            if column in df and pd.api.types.is_numeric_dtype(df[column]):
+                compact = df[column].astype("float32")
+                if ((compact.astype("float64") == df[column]) | df[column].isna()).all():
+                    df[column] = compact
+        return df
+
+    @staticmethod
+    def load_data(file, columns=None):
+        """Read the CSV, or only the given columns, e.g. required_columns() of the analyses to run.
+
+        Whole-row duplicate removal then compares the loaded columns only."""
+        try:
+            with instrument("load_data", columns=None if columns is None else len(columns)) as step:
+                df = pd.read_csv(file, **DataIngestionModule.read_options(columns))
+                before = df.memory_usage(deep=True).sum()
+                df = DataIngestionModule.compact_dtypes(df)
+                after = df.memory_usage(deep=True).sum()
+                step["rows_out"] = len(df)
+            logging.info(f"Data successfully ingested: {len(df)} rows, "
+                         f"{before / 1024 ** 2:.1f} MB -> {after / 1024 ** 2:.1f} MB after dtype compaction.")
+            return df
+        except Exception as e:
+            report_error(f"Data ingestion failed: {str(e)}", f"Error loading data: {str(e)}")
+            return pd.DataFrame()
+
+    @staticmethod
+    def load_chunks(file, chunksize: int = 100_000):
+        """Yield the CSV in chunks of at most chunksize rows.
+
+        An error partway through is reported and re-raised, so callers never mistake the chunks read
+        so far for the whole file."""
+        try:
+            with pd.read_csv(file, chunksize=chunksize, **DataIngestionModule.read_options()) as reader:
+                for chunk in reader:
+                    yield DataIngestionModule.compact_dtypes(chunk)
+        except Exception as e:
+            report_error(f"Data ingestion failed: {str(e)}", f"Error loading data: {str(e)}")
+            raise
+
+    @staticmethod
+    def load_aggregates(file, chunksize: int = 100_000, dedup_key=None, deduplicator=None, track_transactions=False,
+                        sketches=None):
+        """Stream the CSV chunk by chunk, cleaning each one and folding it into SalesAggregates.
+
+        A deduplicator may be passed in, pre-seeded with hashes of rows that must be skipped.
+        track_transactions keeps the TransactionID hashes that appending batches later needs.
+        Chunks are also folded into sketches when given, for approximate analyses; a customer whose
+        rows span chunks then counts as one basket per chunk."""
+        aggregates = SalesAggregates(track_transactions)
+        deduplicator = RowDeduplicator() if deduplicator is None else deduplicator
+        with instrument("load_aggregates") as step:
+            for chunk in DataIngestionModule.load_chunks(file, chunksize):
+                processed = DataProcessingModule(chunk, deduplicator=deduplicator, dedup_key=dedup_key).process_data()
+                aggregates.fold(processed)
+                if sketches is not None:
+                    sketches.fold(processed)
+            step["rows_out"] = aggregates.rows
+        logging.info(f"Streamed {aggregates.rows} rows into aggregates.")
+        return aggregates
+
+    @staticmethod
+    def expand_sources(sources) -> list:
+        """Resolve a directory, glob pattern or list of paths into an ordered list of CSV files"""
+        if isinstance(sources, (str, os.PathLike)):
+            sources = os.fspath(sources)
+            if os.path.isdir(sources):
+                return sorted(glob.glob(os.path.join(sources, "*.csv")))
+            if glob.has_magic(sources):
+                return sorted(glob.glob(sources))
+            return [sources]
+        return [os.fspath(source) for source in sources]
+
+    @staticmethod
+    def load_partitions(sources, max_workers: int = None, chunksize: int = 100_000, dedup_key=None):
+        """Aggregate many CSV partitions in a process pool and merge them in order.
+
+        Rows repeated across partitions are found from each partition's row hashes; the affected
+        partitions are aggregated again without them, so the result equals processing the
+        concatenated files."""
+        paths = DataIngestionModule.expand_sources(sources)
+        with instrument("load_partitions", partitions=len(paths)) as step, \
+                ProcessPoolExecutor(max_workers=max_workers) as pool:
+            partials = list(pool.map(aggregate_partition, paths, repeat(chunksize), repeat(dedup_key)))
+
+            seen, repeated = RowDeduplicator(), {}
+            for position, (_, hashes) in enumerate(partials):
+                duplicates = seen.contains(hashes)
+                if duplicates.any():
+                    repeated[position] = hashes[duplicates]
+                seen.add(hashes[~duplicates])
+            reruns = {position: pool.submit(aggregate_partition, paths[position], chunksize, dedup_key, excluded)
+                      for position, excluded in repeated.items()}
+            for position, future in reruns.items():
+                partials[position] = future.result()
+
+            merged = SalesAggregates()
+            for aggregates, _ in partials:
+                merged.merge(aggregates)
+            step["rows_out"] = merged.rows
+        logging.info(f"Merged {len(paths)} partitions into {merged.rows} rows "
+                     f"({len(repeated)} re-aggregated for cross-partition duplicates).")
+        return merged
+
+
+def aggregate_partition(path, chunksize=100_000, dedup_key=None, excluded=None):
+    """Process pool worker: aggregates of one partition plus the hashes of the rows it kept"""
+    deduplicator = RowDeduplicator()
+    if excluded is not None:
+        deduplicator.add(excluded)
+    aggregates = DataIngestionModule.load_aggregates(path, chunksize, dedup_key, deduplicator)
+    kept = deduplicator.seen if excluded is None else deduplicator.seen[~np.isin(deduplicator.seen, excluded)]
+    return aggregates, kept
+
+
+# Cross-chunk duplicate detection by 64-bit row hashes, kept as sorted runs so each chunk costs O(chunk)
+# amortised instead of a copy of every hash seen so far
+class RowDeduplicator:
+    def __init__(self):
+        self.hashes = SortedRuns(np.uint64)
+
+    @property
+    def seen(self) -> np.ndarray:
+        """Every hash seen, sorted"""
+        return self.hashes.values()
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        return self.hashes.contains(hashes)
+
+    def add(self, hashes: np.ndarray):
+        """Record hashes as seen"""
+        self.hashes.add(hashes)
+
+    def keep(self, df: pd.DataFrame) -> np.ndarray:
+        """Mask of rows not seen earlier in this frame or in any previous frame"""
+        # Numbers are hashed as float64 so a value parsed as int in one chunk matches float in another
+        normalized = df.apply(lambda column: column.astype("float64")
+                              if pd.api.types.is_numeric_dtype(column) else column)
+        hashes = pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+        mask = ~pd.Series(hashes).duplicated().to_numpy() & ~self.contains(hashes)
+        self.add(hashes[mask])
+        return mask
+
+    def merge(self, other: "RowDeduplicator"):
+        for run in other.hashes.runs:
+            self.add(run)
+        return self
+
+    def copy(self) -> "RowDeduplicator":
+        copy = RowDeduplicator()
+        copy.hashes = self.hashes.copy()
+        return copy
+
+
+# Data Processing Module
+class DataProcessingModule:
+    # Stored totals within half a cent of Quantity * PriceperUnit are kept as they are
+    TOTAL_PRICE_TOLERANCE = 0.005
+    # Input columns cleaning reads besides those the analyses need. Duplicates and missing values are judged
+    # on whole rows, so this includes ProductID, which no analysis reads, as the duckdb backend does
+    COLUMNS = ("Date", "Quantity", "PriceperUnit", "TotalPrice", "ProductID")
+
+    def __init__(self, df: pd.DataFrame, deduplicator: RowDeduplicator = None, dedup_key=None):
+        """dedup_key names the column(s) identifying a row, e.g. "TransactionID"; None compares whole rows"""
+        self.df = df
+        self.deduplicator = deduplicator
+        self.dedup_key = [dedup_key] if isinstance(dedup_key, str) else dedup_key
+        self.report = []
+
+    def process_data(self):
+        """Return a cleaned copy of the input frame, leaving the caller's frame untouched"""
+        self.report = []
+        try:
+            df = self.df.copy(deep=False)
+            with instrument("parse_dates", len(df), self.report) as step:
+                if not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+                    df["Date"] = pd.to_datetime(df["Date"], format='%m/%d/%Y', errors='coerce')
+                step["rows_out"] = len(df)
+            with instrument("drop_duplicates", len(df), self.report) as step:
+                df = self.drop_duplicates(df)
+                step["rows_out"] = len(df)
+            with instrument("dropna", len(df), self.report) as step:
+                df = df.dropna()
+                step["rows_out"] = len(df)
+            with instrument("total_price", len(df), self.report) as step:
+                df = self.validate_total_price(df)
+                step["rows_out"] = len(df)
+            logging.info("Data processed successfully: " + ", ".join(
+                f"{record['stage']} {record['seconds']:.3f}s" for record in self.report))
+            return df
+        except Exception as e:
+            report_error(f"Data processing error: {str(e)}")
+            return pd.DataFrame()
+
+    def drop_duplicates(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.deduplicator is not None:
+            return df[self.deduplicator.keep(df if self.dedup_key is None else df[self.dedup_key])]
+        return df.drop_duplicates(subset=self.dedup_key)
+
+    def validate_total_price(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Check an existing TotalPrice against Quantity * PriceperUnit, only replacing rows that disagree"""
+        price = df["PriceperUnit"]
+        if price.dtype == "float32":
+            # Totals are summed over many rows, so keep them in float64 even when unit prices are compact
+            price = price.astype("float64")
+        expected = df["Quantity"] * price
+        if "TotalPrice" not in df:
+            df["TotalPrice"] = expected
+            return df
+        mismatched = ~np.isclose(df["TotalPrice"], expected, rtol=0, atol=self.TOTAL_PRICE_TOLERANCE)
+        if mismatched.any():
+            logging.warning(f"Corrected TotalPrice on {int(mismatched.sum())} rows.")
+            df["TotalPrice"] = df["TotalPrice"].where(~mismatched, expected)
+        return df
+
+
+def concat_partials(left, right, ignore_index=False):
+    """Concatenate partial aggregates, unifying categories so categorical keys stay categorical"""
+    if isinstance(left.index, pd.CategoricalIndex) and isinstance(right.index, pd.CategoricalIndex):
+        categories = left.index.categories.union(right.index.categories)
+        left = left.set_axis(left.index.set_categories(categories))
+        right = right.set_axis(right.index.set_categories(categories))
+    if isinstance(left, pd.DataFrame):
+        left, right = left.copy(deep=False), right.copy(deep=False)
+        for column in left.columns:
+            if isinstance(left[column].dtype, pd.CategoricalDtype) and \
+                    isinstance(right[column].dtype, pd.CategoricalDtype):
+                categories = left[column].cat.categories.union(right[column].cat.categories)
+                left[column] = left[column].cat.set_categories(categories)
+                right[column] = right[column].cat.set_categories(categories)
+    return pd.concat([left, right], ignore_index=ignore_index)
+
+
+# Pre-aggregated rollup cube of sales measures by product, region, month and weekday
+class SalesCube:
+    DIMENSIONS = ["ProductName", "Region", "Month", "Weekday"]
+    MEASURES = ["Quantity", "TotalPrice", "Transactions"]
+    # Input columns read by from_frame
+    COLUMNS = ("ProductName", "Region", "Date", "Quantity", "TotalPrice", "TransactionID")
+
+    def __init__(self, cells: pd.DataFrame):
+        # Partial cells, combined when read; they are never modified, so copies share them
+        self.runs = [cells]
+
+    @property
+    def cells(self) -> pd.DataFrame:
+        """Cells ordered as a groupby over the dimensions orders them"""
+        if len(self.runs) > 1:
+            cells = self.runs[0]
+            for run in self.runs[1:]:
+                cells = concat_partials(cells, run, ignore_index=True)
+            self.runs = [self._regroup(cells)]
+        return self.runs[0]
+
+    @cells.setter
+    def cells(self, cells: pd.DataFrame):
+        self.runs = [cells]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """Build the cube with a single grouped pass over the processed rows"""
+        keys = [
+            df["ProductName"],
+            df["Region"],
+            df["Date"].dt.to_period("M").rename("Month"),
+            df["Date"].dt.day_name().rename("Weekday"),
+        ]
+        cells = df.groupby(keys, observed=True).agg(
+            Quantity=("Quantity", "sum"),
+            TotalPrice=("TotalPrice", "sum"),
+            Transactions=("TransactionID", "count"),
+        ).reset_index()
+        return cls(cells)
+
+    @classmethod
+    def _regroup(cls, cells: pd.DataFrame) -> pd.DataFrame:
+        """Sum cells sharing the same dimension values"""
+        return cells.groupby(cls.DIMENSIONS, observed=True)[cls.MEASURES].sum().reset_index()
+
+    @classmethod
+    def _combine(cls, left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+        return cls._regroup(concat_partials(left, right, ignore_index=True))
+
+    def merge(self, other: "SalesCube"):
+        """Add other's measures in as a run of their own; runs of similar size are combined, so a merge
+        costs the size of other, amortised, rather than of every cell"""
+        self.runs.extend(other.runs)
+        compact_runs(self.runs, self._combine)
+        return self
+
+    def copy(self) -> "SalesCube":
+        """Copy that merge() leaves this cube untouched by; the runs are shared"""
+        copy = object.__new__(SalesCube)
+        copy.runs = list(self.runs)
+        return copy
+
+    def totals(self, dimension, measure="TotalPrice", products=None) -> pd.Series:
+        """Sum a measure over the cube cells by one dimension, optionally for a subset of products"""
+        cells = self.cells if products is None else self.cells[self.cells["ProductName"].isin(products)]
+        return cells.groupby(dimension, observed=True)[measure].sum()
+
+    def grand_total(self, measure="TotalPrice"):
+        return self.cells[measure].sum()
+
+    def product_table(self) -> pd.DataFrame:
+        """Quantity, sales and transaction totals for every product, best sellers first"""
+        return (
+            self.cells.groupby("ProductName", observed=True)
+            .agg(
+                Total_Quantity=("Quantity", "sum"),
+                Total_Sales=("TotalPrice", "sum"),
+                Transactions=("Transactions", "sum")
+            )
+            .sort_values("Total_Sales", ascending=False)
+            .reset_index()
+        )
+
+
+# Dashboard filter; fields left as None do not restrict
+class SalesFilter(NamedTuple):
+    start: pd.Timestamp = None
+    end: pd.Timestamp = None
+    regions: tuple = None
+    products: tuple = None
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self)
+
+
+# Rows sorted by Date with a day -> first-row offset index and categorical region and product codes
+class _DateRun:
+    def __init__(self, df: pd.DataFrame):
+        dates = df["Date"]
+        self.frame = df if dates.is_monotonic_increasing else df.sort_values("Date", kind="stable")
+        days = self.frame["Date"].to_numpy().astype("datetime64[D]")
+        self.offsets = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]) if len(days) else np.empty(0, int)
+        self.days = days[self.offsets]
+        self.regions, self.region_codes = self._codes("Region")
+        self.products, self.product_codes = self._codes("ProductName")
+
+    def _codes(self, column):
+        values = self.frame[column]
+        categorical = values.cat if isinstance(values.dtype, pd.CategoricalDtype) else pd.Categorical(values)
+        return pd.Index(categorical.categories), np.asarray(categorical.codes)
+
+    def bounds(self, start=None, end=None):
+        """Row range [lo, hi) of the days from start to end inclusive, by binary search over distinct days"""
+        lo = 0 if start is None else np.searchsorted(self.days, np.datetime64(start, "D"), "left")
+        hi = len(self.days) if end is None else np.searchsorted(self.days, np.datetime64(end, "D"), "right")
+        row = np.append(self.offsets, len(self.frame))
+        return int(row[lo]), int(row[hi])
+
+    def select(self, sales_filter: SalesFilter) -> pd.DataFrame:
+        """Rows matching the filter: a slice for the dates, then small code comparisons within it"""
+        lo, hi = self.bounds(sales_filter.start, sales_filter.end)
+        mask = None
+        for values, index, codes in [(sales_filter.regions, self.regions, self.region_codes),
+                                     (sales_filter.products, self.products, self.product_codes)]:
+            if values is not None:
+                matches = np.isin(codes[lo:hi], index.get_indexer(list(values)))
+                mask = matches if mask is None else mask & matches
+        rows = self.frame.iloc[lo:hi]
+        return rows if mask is None else rows[mask]
+
+    def __len__(self):
+        return len(self.frame)
+
+
+# Date-sorted rows searchable by day, region and product. Appended batches are sorted on their own as
+# new runs, merged with their neighbours once of similar size, so an append never re-sorts every row
+class DateIndex:
+    COLUMNS = ("Date", "Region", "ProductName")
+
+    def __init__(self, df: pd.DataFrame):
+        self.runs = [_DateRun(df)]
+
+    def extend(self, batch: pd.DataFrame) -> "DateIndex":
+        """A new index over these rows plus batch, leaving this one as it is"""
+        index = object.__new__(DateIndex)
+        index.runs = self.runs + [_DateRun(batch)]
+        while len(index.runs) > 1 and len(index.runs[-2]) <= 2 * len(index.runs[-1]):
+            right = index.runs.pop()
+            index.runs[-1] = _DateRun(concat_partials(index.runs[-1].frame, right.frame, ignore_index=True))
+        return index
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Every row, sorted by Date; the runs are merged into one"""
+        if len(self.runs) > 1:
+            frame = self.runs[0].frame
+            for run in self.runs[1:]:
+                frame = concat_partials(frame, run.frame, ignore_index=True)
+            self.runs = [_DateRun(frame)]
+        return self.runs[0].frame
+
+    @property
+    def days(self) -> np.ndarray:
+        """Distinct days with rows, in order"""
+        return self.runs[0].days if len(self.runs) == 1 else np.unique(np.concatenate([run.days for run in self.runs]))
+
+    @property
+    def regions(self) -> pd.Index:
+        return self._union("regions")
+
+    @property
+    def products(self) -> pd.Index:
+        return self._union("products")
+
+    def _union(self, name) -> pd.Index:
+        index = getattr(self.runs[0], name)
+        for run in self.runs[1:]:
+            index = index.union(getattr(run, name))
+        return index
+
+    def select(self, sales_filter: SalesFilter) -> pd.DataFrame:
+        """Rows matching the filter, selected from each run"""
+        rows = self.runs[0].select(sales_filter)
+        for run in self.runs[1:]:
+            rows = concat_partials(rows, run.select(sales_filter), ignore_index=True)
+        return rows
+
+
+# Inverted n-gram index over distinct product names with precomputed per-product aggregates
+class ProductSearchIndex:
+    NGRAM = 3
+
+    def __init__(self, cube: SalesCube):
+        self.product_table = cube.product_table()
+        self.names = self.product_table["ProductName"].astype(str).tolist()
+        self.normalized = [name.casefold() for name in self.names]
+        self.ngrams = defaultdict(set)
+        for code, name in enumerate(self.normalized):
+            for ngram in self._ngrams(name):
+                self.ngrams[ngram].add(code)
+
+        # Product x Region and Product x Month sales, rows aligned with product_table
+        cells = cube.cells.assign(ProductName=cube.cells["ProductName"].astype(str))
+        self.by_region = cells.pivot_table(index="ProductName", columns="Region", values="TotalPrice",
+                                           aggfunc="sum", observed=True).reindex(self.names)
+        self.by_month = cells.pivot_table(index="ProductName", columns="Month", values="TotalPrice",
+                                          aggfunc="sum").reindex(self.names)
+
+    @classmethod
+    def _ngrams(cls, text):
+        return {text[i:i + cls.NGRAM] for i in range(len(text) - cls.NGRAM + 1)}
+
+    def search(self, term: str) -> list:
+        """Positions of the products whose name contains term, ignoring case"""
+        term = term.casefold()
+        if len(term) >= self.NGRAM:
+            candidates = set.intersection(*(self.ngrams.get(ngram, set()) for ngram in self._ngrams(term)))
+        else:
+            candidates = range(len(self.names))
+        return sorted(code for code in candidates if term in self.normalized[code])
+
+    def matching_names(self, codes) -> list:
+        return [self.names[code] for code in codes]
+
+    def totals(self, codes):
+        """Total sales and quantity of the given products"""
+        rows = self.product_table.iloc[codes]
+        return rows["Total_Sales"].sum(), rows["Total_Quantity"].sum()
+
+    def regional(self, codes) -> pd.Series:
+        return self.by_region.iloc[codes].sum(min_count=1).dropna().sort_values(ascending=False)
+
+    def monthly(self, codes) -> pd.Series:
+        return self.by_month.iloc[codes].sum(min_count=1).dropna()
+
+
+def purchase_value_counts(df: pd.DataFrame) -> pd.Series:
+    """Rows per distinct TotalPrice, sorted by value; mergeable and enough for exact quantiles"""
+    return df["TotalPrice"].value_counts().sort_index()
+
+
+def quantiles_from_counts(counts: pd.Series, quantiles) -> pd.Series:
+    """Quantiles of the values in counts' index weighted by its counts, interpolated as Series.quantile does"""
+    index = pd.Index(quantiles, name="Quantile")
+    if not len(counts):
+        return pd.Series(np.nan, index=index, name="TotalPrice")
+    values, cumulative = counts.index.to_numpy(dtype="float64"), np.cumsum(counts.to_numpy())
+    positions = np.asarray(quantiles) * (cumulative[-1] - 1)
+    lower = values[np.searchsorted(cumulative, np.floor(positions), "right")]
+    upper = values[np.searchsorted(cumulative, np.ceil(positions), "right")]
+    return pd.Series(lower + (upper - lower) * (positions - np.floor(positions)), index=index, name="TotalPrice")
+
+
+# Mergeable aggregate state behind the standard analyses, built chunk by chunk
+class SalesAggregates:
+    def __init__(self, track_transactions=False):
+        """track_transactions keeps a hash of every TransactionID folded in, which append() needs to skip
+        transactions it has already counted"""
+        self.rows = 0
+        self.cube = None
+        # Partial per-customer totals as runs sorted by CustomerID, combined when read; each chunk adds
+        # a run and runs of similar size are combined, so no chunk regroups every customer. Runs are
+        # never modified, so copies share them.
+        self.customer_runs = []
+        self.pairs = None
+        self.purchase_values = None
+        self.transactions = RowDeduplicator() if track_transactions else None
+
+    @property
+    def customers(self) -> pd.DataFrame:
+        """Per-customer totals sorted by CustomerID, so top-N ties resolve as they would on a full recompute"""
+        if len(self.customer_runs) > 1:
+            self.customer_runs = [self._regroup_customers(pd.concat(self.customer_runs))]
+        return self.customer_runs[0] if self.customer_runs else None
+
+    @customers.setter
+    def customers(self, customers: pd.DataFrame):
+        self.customer_runs = [] if customers is None else [customers]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, track_transactions=False):
+        """Aggregate state of a single processed frame"""
+        aggregates = cls(track_transactions)
+        aggregates.rows = len(df)
+        aggregates.cube = SalesCube.from_frame(df)
+        aggregates.customers = df.groupby("CustomerID").agg(
+            TotalSpend=("TotalPrice", "sum"),
+            PurchaseCount=("TotalPrice", "count"),
+            LastPurchase=("Date", "max"),
+        )
+        aggregates.pairs = ProductPairEngine(df)
+        aggregates.purchase_values = purchase_value_counts(df)
+        if track_transactions:
+            aggregates.transactions.add(aggregates._transaction_hashes(df))
+        return aggregates
+
+    def fold(self, df: pd.DataFrame):
+        """Fold a processed chunk into the running state"""
+        return self.merge(SalesAggregates.from_frame(df, self.transactions is not None))
+
+    def append(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Fold a processed batch of new transactions, skipping TransactionIDs already counted; returns the rows folded"""
+        if self.transactions is None:
+            raise ValueError("append() needs aggregates built with track_transactions=True")
+        fresh = df[~self.transactions.contains(self._transaction_hashes(df))]
+        logging.info(f"Appending {len(fresh)} new transactions ({len(df) - len(fresh)} already known).")
+        self.fold(fresh)
+        return fresh
+
+    @staticmethod
+    def _transaction_hashes(df: pd.DataFrame) -> np.ndarray:
+        return pd.util.hash_pandas_object(df[["TransactionID"]].astype("float64"), index=False).to_numpy()
+
+    def merge(self, other: "SalesAggregates"):
+        """Combine another partial state into this one, as if both inputs had been concatenated.
+
+        Only the cube cells, customers and baskets present in other are touched; other must not be
+        used afterwards."""
+        if other.rows == 0:
+            return self
+        if self.rows == 0:
+            transactions = self.transactions
+            vars(self).update(vars(other))
+            if transactions is not None and self.transactions is None:
+                self.transactions = transactions
+            return self
+        self.rows += other.rows
+        self.cube.merge(other.cube)
+        for run in other.customer_runs:
+            self.merge_customers(run)
+        self.pairs.merge(other.pairs)
+        self.purchase_values = self.purchase_values.add(other.purchase_values, fill_value=0).astype("int64")
+        if self.transactions is not None and other.transactions is not None:
+            self.transactions.merge(other.transactions)
+        return self
+
+    def merge_customers(self, delta: pd.DataFrame):
+        """Add delta's per-customer totals in as a run of their own"""
+        self.customer_runs.append(delta)
+        compact_runs(self.customer_runs, lambda left, right: self._regroup_customers(pd.concat([left, right])))
+
+    @staticmethod
+    def _regroup_customers(customers: pd.DataFrame) -> pd.DataFrame:
+        return customers.groupby(level=0).agg(TotalSpend=("TotalSpend", "sum"),
+                                              PurchaseCount=("PurchaseCount", "sum"),
+                                              LastPurchase=("LastPurchase", "max"))
+
+    @classmethod
+    def from_intermediates(cls, df: pd.DataFrame, intermediates: dict):
+        """State of the processed frame df built from its already computed intermediates, which it shares,
+        so copy() it before folding anything in. Only the TransactionID hashes are computed from the rows."""
+        aggregates = cls(track_transactions=True)
+        aggregates.rows = len(df)
+        aggregates.cube = intermediates["cube"]
+        aggregates.customers = intermediates["customer_summary"][["TotalSpend", "PurchaseCount", "LastPurchase"]]
+        aggregates.pairs = intermediates["pair_engine"]
+        aggregates.purchase_values = intermediates["purchase_value_counts"]
+        aggregates.transactions.add(cls._transaction_hashes(df))
+        return aggregates
+
+    def copy(self) -> "SalesAggregates":
+        """Copy that merge() and append() leave this state untouched by. Cube cells, customer totals,
+        baskets and TransactionID hashes are kept in shared runs, so copying costs their number, not their size."""
+        copy = SalesAggregates()
+        copy.rows = self.rows
+        copy.cube = None if self.cube is None else self.cube.copy()
+        copy.customer_runs = list(self.customer_runs)
+        copy.pairs = None if self.pairs is None else self.pairs.copy()
+        copy.purchase_values = self.purchase_values
+        copy.transactions = None if self.transactions is None else self.transactions.copy()
+        return copy
+
+    def customer_summary(self) -> pd.DataFrame:
+        """Per-customer summary in the shape DataAnalysisModule computes from a full frame"""
+        customers = self.customers
+        return pd.DataFrame({
+            "TotalSpend": customers["TotalSpend"],
+            "AveragePurchase": customers["TotalSpend"] / customers["PurchaseCount"],
+            "PurchaseCount": customers["PurchaseCount"],
+            "LastPurchase": customers["LastPurchase"],
+        })
+
+    def intermediates(self) -> dict:
+        """Intermediates in the shape DataAnalysisModule computes from a full frame that are ready as they are;
+        customer_summary() combines every customer run, so it is left until an analysis reads it"""
+        return {
+            "cube": self.cube,
+            "pair_engine": self.pairs,
+            "purchase_value_counts": self.purchase_values,
+        }
+
+
+# Constant-memory sketches behind the approximate analyses, folded chunk by chunk
+class SalesSketches:
+    CHUNK_ROWS = 1_000_000
+    COLUMNS = ("CustomerID", "ProductName", "Quantity", "TotalPrice")
+    PAIR_SEPARATOR = "\x1f"
+
+    def __init__(self):
+        self.rows = 0
+        self.baskets = 0
+        self.product_quantity = HeavyHitters()
+        self.customer_spend = HeavyHitters()
+        self.customer_purchases = HeavyHitters()
+        self.product_baskets = HeavyHitters()
+        self.pair_baskets = HeavyHitters()
+        self.customers = HyperLogLog()
+        self.purchase_values = TDigest()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, chunk_rows: int = CHUNK_ROWS):
+        """Fold a frame in chunks that each hold whole customers, so per-customer baskets are never split"""
+        sketches = cls()
+        partitions = max(len(df) // chunk_rows, 1)
+        partition = (pd.util.hash_array(df["CustomerID"].to_numpy()) % np.uint64(partitions)).astype(np.int32)
+        order = np.argsort(partition, kind="stable")
+        bounds = np.searchsorted(partition[order], np.arange(partitions + 1))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            sketches.fold(df.iloc[order[lo:hi]])
+        return sketches
+
+    def fold(self, df: pd.DataFrame):
+        """Fold a processed chunk; basket and pair counts are exact only if no customer's rows span chunks"""
+        if df.empty:
+            return self
+        self.rows += len(df)
+        customers = df["CustomerID"].to_numpy()
+        self.product_quantity.add(df["ProductName"].astype(str), df["Quantity"])
+        self.customer_spend.add(customers, df["TotalPrice"])
+        self.customer_purchases.add(customers)
+        self.customers.add(customers)
+        self.purchase_values.add(df["TotalPrice"])
+
+        # Basket x product incidence on integer codes; its Gram matrix counts the baskets holding each
+        # pair, so only distinct pairs are ever named. Codes follow sorted names, so row < col orders
+        # each pair's names the same way in every chunk.
+        from scipy import sparse
+        basket_codes, baskets = pd.factorize(customers)
+        item_codes, items = pd.factorize(df["ProductName"].astype(str), sort=True)
+        known = (basket_codes >= 0) & (item_codes >= 0)
+        incidence = sparse.coo_matrix((np.ones(known.sum(), dtype=np.int64), (basket_codes[known], item_codes[known])),
+                                      shape=(len(baskets), len(items))).tocsr()
+        incidence.data[:] = 1
+        self.baskets += len(baskets)
+        items = items.to_numpy(dtype=object)
+        self.product_baskets.add(items, np.asarray(incidence.sum(axis=0)).ravel())
+        pairs = sparse.triu(incidence.T @ incidence, k=1).tocoo()
+        self.pair_baskets.add(items[pairs.row] + self.PAIR_SEPARATOR + items[pairs.col], pairs.data)
+        return self
+
+    def merge(self, other: "SalesSketches"):
+        self.rows += other.rows
+        self.baskets += other.baskets
+        for name in ["product_quantity", "customer_spend", "customer_purchases", "product_baskets",
+                     "pair_baskets", "customers", "purchase_values"]:
+            getattr(self, name).merge(getattr(other, name))
+        return self
+
+    @staticmethod
+    def describe(result, method: str, error_bound: float, detail: str):
+        """Attach the documented error bound so the UI can label the result as approximate"""
+        result.attrs["approximate"] = {"method": method, "error_bound": error_bound, "description": detail}
+        return result
+
+    def top(self, hitters: HeavyHitters, n: int, index_name: str, name: str, dtype=None) -> pd.Series:
+        top, overestimate = hitters.top(n)
+        result = top.astype(dtype) if dtype else top
+        result = result.rename(name).rename_axis(index_name)
+        bound = min(overestimate, hitters.sketch.error_bound)
+        return self.describe(result, "Space-Saving + Count-Min", bound,
+                             f"Each value may overestimate the true total by at most {bound:,.2f}; "
+                             f"the Count-Min bound holds with {hitters.sketch.confidence:.0%} probability.")
+
+    def top_pairs(self, top_n=10, min_support=0.0, min_confidence=0.0, min_lift=0.0) -> pd.DataFrame:
+        candidates, overestimate = self.pair_baskets.top(len(self.pair_baskets.summary.counts))
+        if not len(candidates) or not self.baskets:
+            return pd.DataFrame(columns=PAIR_COLUMNS)
+        names = candidates.index.to_series().str.split(self.PAIR_SEPARATOR, expand=True)
+        first, second = names[0].to_numpy(), names[1].to_numpy()
+        pairs = pair_table(first, second, candidates.to_numpy().round(), self.product_baskets.estimate(first),
+                           self.product_baskets.estimate(second), self.baskets, top_n, min_support,
+                           min_confidence, min_lift)
+        bound = min(overestimate, self.pair_baskets.sketch.error_bound)
+        return self.describe(pairs, "Space-Saving + Count-Min", bound,
+                             f"Each frequency may overestimate the number of customers buying the pair "
+                             f"by at most {bound:,.0f}.")
+
+    def distinct_customers(self) -> pd.Series:
+        estimate = self.customers.count()
+        return self.describe(pd.Series([round(estimate)], index=["Distinct Customers"], name="CustomerID"),
+                             "HyperLogLog", estimate * self.customers.relative_error,
+                             f"Standard error {self.customers.relative_error:.1%} of the count.")
+
+    def quantiles(self, quantiles) -> pd.Series:
+        digest = self.purchase_values
+        result = pd.Series([digest.quantile(q) for q in quantiles], index=pd.Index(quantiles, name="Quantile"),
+                           name="TotalPrice")
+        return self.describe(result, "t-digest", 1 / digest.compression,
+                             f"Quantiles are typically within {1 / digest.compression:.1%} in rank; "
+                             f"min and max are exact.")
+
+
+# Observer Pattern for Data Analysis
+class Observer(ABC):
+    @abstractmethod
+    def update(self, data):
+        pass
+
+
+# Lazy registry of analysis results, each computed on first access and memoized
+class AnalysisResults(Mapping):
+    def __init__(self, row_count=None, on_result=None):
+        """row_count is an optional callable giving the input rows recorded for each computation and
+        on_result one called with the name of each result memoized, e.g. to re-measure a cache entry"""
+        self._factories = {}
+        self._results = {}
+        self._row_count = row_count
+        self._on_result = on_result
+        self._requires = {}
+        self._prerequisites = {}
+        self._futures = {}
+        self._errors = {}
+        self._prerequisite_futures = {}
+        self._locks = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+        self._generation = 0
+
+    def register(self, name, factory, requires=()):
+        """Register a zero-argument callable that computes the named result on demand.
+
+        requires names prerequisites that prefetch() computes before submitting the result's job."""
+        self._factories[name] = factory
+        self._requires[name] = tuple(requires)
+        self._results.pop(name, None)
+
+    def register_prerequisite(self, name, compute, requires=()):
+        """Register shared work, e.g. an intermediate aggregate, that prefetch() runs once for every result needing it"""
+        self._prerequisites[name] = (compute, tuple(requires))
+
+    def __setitem__(self, name, value):
+        self._factories[name] = None
+        self._results[name] = value
+
+    def __getitem__(self, name):
+        factory = self._factories[name]
+        if name in self._results:
+            return self._results[name]
+        # Errors raised in background jobs are reported here, on the thread that reads the result,
+        # since a worker thread cannot display them; the next access recomputes
+        error = self._errors.pop(name, None)
+        try:
+            if error is not None:
+                raise error
+            return self._compute(name, factory)
+        except Exception as e:
+            report_error(f"Error in {name} analysis: {str(e)}")
+            return pd.Series(dtype="float64")
+
+    def _compute(self, name, factory):
+        with self._locks_guard:
+            lock = self._locks[name]
+        # A caller asking for a result a background job is computing waits for it instead of recomputing
+        with lock:
+            if name in self._results:
+                return self._results[name]
+            generation = self._generation
+            with instrument(name, self._row_count() if self._row_count else None, cache="miss") as step:
+                result = factory()
+                step["rows_out"] = result_rows(result)
+            # Results computed from state that reset() has since replaced are returned but not kept
+            if generation == self._generation:
+                self._results[name] = result
+                if self._on_result is not None:
+                    self._on_result(name)
+            return result
+
+    def _compute_in_background(self, name):
+        generation = self._generation
+        try:
+            self._compute(name, self._factories[name])
+        except Exception as e:
+            if generation == self._generation:
+                self._errors[name] = e
+
+    def prefetch(self, executor, names=None):
+        """Compute results not yet memoized on a concurrent.futures executor, in the given order.
+
+        The shared prerequisites of all of them are submitted first, each once, so they run
+        concurrently with each other and the results reading them mostly find them ready."""
+        names = [name for name in (names or list(self._factories))
+                 if name not in self._results and self._factories[name] is not None and not self.pending(name)]
+        for name in names:
+            for required in self._requires[name]:
+                self._prefetch_prerequisite(executor, required)
+        for name in names:
+            self._futures[name] = executor.submit(self._compute_in_background, name)
+
+    def _prefetch_prerequisite(self, executor, name):
+        future = self._prerequisite_futures.get(name)
+        if future is None or future.cancelled() or (future.done() and future.exception() is not None):
+            compute, requires = self._prerequisites[name]
+            for required in requires:
+                self._prefetch_prerequisite(executor, required)
+            self._prerequisite_futures[name] = executor.submit(compute)
+
+    def pending(self, name) -> bool:
+        """Whether a background job for the result is queued or running"""
+        future = self._futures.get(name)
+        return future is not None and not future.done()
+
+    def cancel(self) -> int:
+        """Cancel queued background jobs, returning how many were cancelled; running ones finish"""
+        futures = list(self._prerequisite_futures.values()) + list(self._futures.values())
+        return sum(future.cancel() for future in futures)
+
+    def reset(self):
+        """Forget memoized results so they are recomputed from refreshed state on next access"""
+        self._generation += 1
+        # Prerequisites are recomputed from the refreshed state too
+        self._prerequisite_futures = {}
+        self._errors = {}
+        self._results = {name: value for name, value in self._results.items() if self._factories[name] is None}
+
+    def is_computed(self, name) -> bool:
+        return name in self._results
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+
+# Declared inputs of a registered analysis or shared intermediate
+class AnalysisSpec(NamedTuple):
+    name: str
+    compute: Callable
+    columns: tuple = ()
+    requires: tuple = ()
+    approximate_requires: tuple = None
+
+    def intermediates(self, approximate=False) -> tuple:
+        """Intermediates the computation reads; approximate analyses may read sketches instead"""
+        if approximate and self.approximate_requires is not None:
+            return self.approximate_requires
+        return self.requires
+
+
+# Registries filled by the decorators below, in registration order
+ANALYSES = {}
+INTERMEDIATES = {}
+
+
+def register_analysis(name, columns=(), requires=(), approximate_requires=None):
+    """Decorator registering a function of the DataAnalysisModule as the analysis result called name.
+
+    columns are the input columns it reads directly and requires the intermediates it reads, so
+    loaders can prune columns and prefetch() can compute each intermediate once, ahead of its users.
+    Plugins register plain functions taking the module, e.g.
+
+        @register_analysis("product_months", requires=("cube",))
+        def product_months(analysis):
+            return analysis.cube().cells.groupby(["ProductName", "Month"], observed=True)["TotalPrice"].sum()
+    """
+    def decorator(compute):
+        ANALYSES[name] = AnalysisSpec(name, compute, tuple(columns), tuple(requires),
+                                      None if approximate_requires is None else tuple(approximate_requires))
+        return compute
+    return decorator
+
+
+def register_intermediate(name, columns=(), requires=()):
+    """Decorator registering the DataAnalysisModule accessor of a shared intermediate and its inputs"""
+    def decorator(compute):
+        INTERMEDIATES[name] = AnalysisSpec(name, compute, tuple(columns), tuple(requires))
+        return compute
+    return decorator
+
+
+def required_intermediates(names, approximate=None) -> list:
+    """Intermediates behind the named analyses or intermediates, prerequisites first.
+
+    approximate=None includes those of both modes."""
+    ordered = []
+
+    def visit(spec, modes):
+        for mode in modes:
+            for required in spec.intermediates(mode):
+                if required not in ordered:
+                    visit(INTERMEDIATES[required], modes)
+                    ordered.append(required)
+
+    modes = (False, True) if approximate is None else (approximate,)
+    for name in names:
+        visit(ANALYSES[name] if name in ANALYSES else INTERMEDIATES[name], modes)
+    return ordered
+
+
+def required_columns(names, approximate=None) -> list:
+    """Input columns the named analyses or intermediates read, directly or through intermediates"""
+    columns = []
+    specs = [ANALYSES.get(name, INTERMEDIATES.get(name)) for name in names]
+    for spec in specs + [INTERMEDIATES[name] for name in required_intermediates(names, approximate)]:
+        columns.extend(column for column in spec.columns if column not in columns)
+    return columns
+
+
+class DataAnalysisModule(Observer):
+    # Filtered or approximate views kept per analysis, least recently used dropped first
+    MAX_VIEWS = 8
+    PURCHASE_QUANTILES = [0.25, 0.5, 0.75, 0.9, 0.99]
+    # Raw columns an appended batch needs; TotalPrice is derived when absent
+    BATCH_COLUMNS = ("TransactionID", "CustomerID", "ProductName", "Region", "Date", "Quantity", "PriceperUnit")
+
+    def __init__(self, df, approximate=False):
+        """approximate=True answers top-N, distinct-count and quantile analyses from SalesSketches"""
+        self.df = df
+        self.approximate = approximate
+        self.aggregates = None
+        self.applied_batches = set()
+        self.appended_rows = []
+        # Called with the name of every result memoized by analyze() and by the views derived from it
+        self.on_result = None
+        self._intermediates = {}
+        self._intermediate_locks = defaultdict(threading.Lock)
+        self._intermediate_guard = threading.Lock()
+        self._append_lock = threading.Lock()
+
+    @classmethod
+    def from_aggregates(cls, aggregates, sketches=None):
+        """Analysis served from pre-folded SalesAggregates instead of the row-level frame.
+
+        Passing the SalesSketches streamed alongside them makes it approximate."""
+        analysis = cls(None, approximate=sketches is not None)
+        analysis.aggregates = aggregates
+        analysis._intermediates.update(aggregates.intermediates())
+        if sketches is not None:
+            analysis._intermediates["sketches"] = sketches
+        return analysis
+
+    def update(self, df):
+        self.df = df
+        self.aggregates = None
+        self.applied_batches = set()
+        self.appended_rows = []
+        self._intermediates = {}
+
+    def base_aggregates(self) -> SalesAggregates:
+        """State that batches are appended to: the running aggregates, or state seeded once from the
+        intermediates of self.df. It is shared, so copy() it before appending."""
+        if self.aggregates is not None:
+            return self.aggregates
+        return self.intermediate("aggregates", lambda: SalesAggregates.from_intermediates(self.df, {
+            "cube": self.cube(),
+            "customer_summary": self.customer_summary(),
+            "pair_engine": self.pair_engine(),
+            "purchase_value_counts": self.purchase_value_counts(),
+        }))
+
+    def copy(self) -> "DataAnalysisModule":
+        """Module over the same data whose append() leaves this one, and the results computed from it, untouched.
+
+        Results and intermediates already computed are reused until the first append."""
+        analysis = DataAnalysisModule(self.df, self.approximate)
+        analysis.aggregates = self.base_aggregates().copy()
+        analysis.applied_batches = set(self.applied_batches)
+        analysis.appended_rows = list(self.appended_rows)
+        analysis._intermediates = {name: value for name, value in self._intermediates.items() if name != "views"}
+        return analysis
+
+    def append(self, batch: pd.DataFrame, batch_id=None) -> bool:
+        """Fold a raw batch of new transactions into the running aggregates, in place; see copy().
+
+        Cost scales with the batch: rows with known TransactionIDs are skipped and only the cube
+        cells, customers and baskets it touches are updated. self.df keeps the original rows.
+        A batch_id that was already applied, or one missing a column the aggregates need, is ignored;
+        returns whether the batch was folded in."""
+        missing = [column for column in self.BATCH_COLUMNS if column not in batch.columns]
+        if missing:
+            report_error(f"Skipped appended batch: missing columns {', '.join(missing)}")
+            return False
+        processed = DataProcessingModule(batch, dedup_key="TransactionID").process_data()
+        if processed.empty and not len(processed.columns):
+            # Processing failed and has reported why
+            return False
+        with self._append_lock, instrument("append", len(processed)) as step:
+            if batch_id is not None and batch_id in self.applied_batches:
+                return False
+            if self.aggregates is None:
+                self.aggregates = self.base_aggregates().copy()
+            fresh = self.aggregates.append(processed)
+            previous, self._intermediates = self._intermediates, self.aggregates.intermediates()
+            if self.df is not None:
+                fresh = fresh[self.df.columns.intersection(fresh.columns, sort=False)]
+                self.appended_rows.append(fresh)
+                # The batch becomes a run of its own in the date index instead of re-sorting every row
+                date_index = previous.get("date_index")
+                if date_index is not None:
+                    self._intermediates["date_index"] = date_index.extend(fresh)
+            step["rows_out"] = self.aggregates.rows
+            if batch_id is not None:
+                self.applied_batches.add(batch_id)
+            return True
+
+    def analyze(self, names=None):
+        """Lazy results of the registered analyses, all of them unless names are given.
+
+        Each result declares its intermediates, so prefetch() computes every shared aggregate once and
+        the analyses that only read it run concurrently."""
+        results = AnalysisResults(row_count=self.row_count, on_result=self.on_result)
+        for spec in (ANALYSES.values() if names is None else [ANALYSES[name] for name in names]):
+            results.register(spec.name, self.bind(spec), spec.intermediates(self.approximate))
+        for name in required_intermediates(list(results), self.approximate):
+            spec = INTERMEDIATES[name]
+            results.register_prerequisite(name, self.bind(spec), spec.requires)
+        return results
+
+    def bind(self, spec: AnalysisSpec) -> Callable:
+        """The spec's computation on this module. Methods registered in a class body are looked up on
+        the instance, so subclasses such as other execution backends can override them."""
+        name = spec.compute.__name__
+        if any(vars(cls).get(name) is spec.compute for cls in type(self).__mro__):
+            return getattr(self, name)
+        return partial(spec.compute, self)
+
+    def intermediate(self, name, compute):
+        """Shared aggregate that several analyses reuse, computed once until update()"""
+        intermediates = self._intermediates
+        if name not in intermediates:
+            # Concurrent analyses needing the same intermediate compute it once
+            with self._intermediate_guard:
+                lock = self._intermediate_locks[name]
+            with lock:
+                if name not in intermediates:
+                    with instrument(f"intermediate:{name}", self.row_count(), cache="miss") as step:
+                        value = compute()
+                        step["rows_out"] = result_rows(value)
+                    # Stored in the dict it was computed for, so update() or append() meanwhile discards it
+                    intermediates[name] = value
+        return intermediates[name]
+
+    def rows(self) -> pd.DataFrame:
+        """Row-level data including appended batches; None for analyses built from aggregates only"""
+        if self.df is None or not self.appended_rows:
+            return self.df
+
+        def concatenate():
+            rows = self.df
+            for batch in self.appended_rows:
+                rows = concat_partials(rows, batch, ignore_index=True)
+            return rows
+        # Concatenated once per append, on first use
+        return self.intermediate("rows", concatenate)
+
+    @register_intermediate("date_index", columns=DateIndex.COLUMNS)
+    def date_index(self) -> DateIndex:
+        return self.intermediate("date_index", lambda: DateIndex(self.rows()))
+
+    def view(self, sales_filter: SalesFilter = None, approximate=False):
+        """(analysis, results) restricted to the filter and/or approximate, memoized until the data changes.
+
+        The filtered rows are a slice of the Date-sorted frame, so a narrower window aggregates fewer rows."""
+        sales_filter = sales_filter or SalesFilter()
+        if sales_filter.is_empty() and not approximate:
+            raise ValueError("view needs a non-empty SalesFilter or approximate=True")
+        if self.df is None:
+            raise ValueError("Views need row-level data; this analysis was built from aggregates only")
+        key = (sales_filter, approximate)
+        views = self.intermediate("views", OrderedDict)
+        with self._intermediate_guard:
+            view = views.get(key)
+            if view is not None:
+                views.move_to_end(key)
+                return view
+        if sales_filter.is_empty():
+            rows = self.rows()
+        else:
+            with instrument("filter", self.row_count()) as step:
+                rows = self.date_index().select(sales_filter)
+                step["rows_out"] = len(rows)
+        analysis = DataAnalysisModule(rows, approximate=approximate)
+        analysis.on_result = self.on_result
+        view = analysis, analysis.analyze()
+        with self._intermediate_guard:
+            views[key] = view
+            while len(views) > self.MAX_VIEWS:
+                views.popitem(last=False)
+        return view
+
+    def headline_totals(self):
+        """Total sales and transaction count, from the cube once it is built, otherwise one pass over the frame"""
+        cube = self._intermediates.get("cube")
+        if cube is not None:
+            return cube.grand_total("TotalPrice"), cube.grand_total("Transactions")
+        return self.df["TotalPrice"].sum(), self.df["TransactionID"].count()
+
+    def row_count(self) -> int:
+        """Rows the analyses are computed over, including appended batches"""
+        return self.aggregates.rows if self.aggregates is not None else len(self.df)
+
+    @register_intermediate("cube", columns=SalesCube.COLUMNS)
+    def cube(self):
+        """Rollup cube that all sales-by-dimension analyses are answered from"""
+        return self.intermediate("cube", lambda: SalesCube.from_frame(self.df))
+
+    @register_intermediate("product_quantity", requires=("cube",))
+    def product_quantity(self):
+        return self.intermediate("product_quantity", lambda: self.cube().totals("ProductName", "Quantity"))
+
+    @register_intermediate("monthly_sales", requires=("cube",))
+    def monthly_totals(self):
+        return self.intermediate("monthly_sales", lambda: self.cube().totals("Month"))
+
+    @register_intermediate("regional_sales", requires=("cube",))
+    def regional_totals(self):
+        return self.intermediate("regional_sales", lambda: self.cube().totals("Region"))
+
+    @register_intermediate("daily_sales", requires=("cube",))
+    def daily_totals(self):
+        return self.intermediate("daily_sales", lambda: self.cube().totals("Weekday"))
+
+    @register_intermediate("customer_summary", columns=("CustomerID", "TotalPrice", "Date"))
+    def customer_summary(self):
+        """Per-customer spend total, mean and count plus last purchase date, computed in one grouped pass"""
+        if self.aggregates is not None:
+            return self.intermediate("customer_summary", self.aggregates.customer_summary)
+        return self.intermediate("customer_summary", lambda: self.df.groupby("CustomerID").agg(
+            TotalSpend=("TotalPrice", "sum"),
+            AveragePurchase=("TotalPrice", "mean"),
+            PurchaseCount=("TotalPrice", "count"),
+            LastPurchase=("Date", "max"),
+        ))
+
+    @register_intermediate("rfm", requires=("customer_summary",))
+    def rfm(self):
+        """RFM scores and segments of every customer, re-scored from the customer summary in one vectorized pass.
+
+        After append() the summary is the incrementally merged one, so no rows are regrouped."""
+        return self.intermediate("rfm", lambda: rfm_table(self.customer_summary()))
+
+    @register_intermediate("pair_engine", columns=("CustomerID", "ProductName"))
+    def pair_engine(self):
+        return self.intermediate("pair_engine", lambda: ProductPairEngine(self.df))
+
+    @register_intermediate("purchase_value_counts", columns=("TotalPrice",))
+    def purchase_value_counts(self) -> pd.Series:
+        return self.intermediate("purchase_value_counts", lambda: purchase_value_counts(self.df))
+
+    @register_intermediate("sketches", columns=SalesSketches.COLUMNS)
+    def sketches(self) -> SalesSketches:
+        return self.intermediate("sketches", lambda: SalesSketches.from_frame(self.rows()))
+
+    @register_analysis("best_selling_products", requires=("product_quantity",), approximate_requires=("sketches",))
+    def best_selling_products_analysis(self):
+        """Analyzing the top 10 products by quantity sold"""
+        if self.approximate:
+            return self.sketches().top(self.sketches().product_quantity, 10, "ProductName", "Quantity", "int64")
+        return self.product_quantity().sort_values(ascending=False).head(10)
+
+    @register_analysis("monthly_sales", requires=("monthly_sales",))
+    def monthly_sales_analysis(self):
+        """Analyzing total sales per month"""
+        return self.monthly_totals()
+
+    @register_analysis("regional_sales", requires=("regional_sales",))
+    def regional_sales_analysis(self):
+        """Analyzing total sales per region"""
+        return self.regional_totals().sort_values(ascending=False)
+
+    @register_analysis("sales_by_day", requires=("daily_sales",))
+    def sales_by_day_analysis(self):
+        """Analyzing total sales per day of the week"""
+        return self.daily_totals().sort_values(ascending=False)
+
+    def top_customers(self, column, name, n=10):
+        return self.customer_summary()[column].nlargest(n).rename(name)
+
+    @register_analysis("frequent_customers", requires=("customer_summary",), approximate_requires=("sketches",))
+    def frequent_customers_analysis(self):
+        """Analyzing frequent customers by total amount spent"""
+        if self.approximate:
+            return self.sketches().top(self.sketches().customer_spend, 10, "CustomerID", "TotalPrice")
+        return self.top_customers("TotalSpend", "TotalPrice")
+
+    @register_analysis("average_purchase_value", requires=("customer_summary",))
+    def average_purchase_value_analysis(self):
+        """Analyzing the average purchase value per customer"""
+        return self.top_customers("AveragePurchase", "TotalPrice")
+
+    @register_analysis("customer_recency", requires=("customer_summary",))
+    def customer_recency_analysis(self):
+        """Analyzing customer recency by the date of their last purchase"""
+        return self.top_customers("LastPurchase", "Date")
+
+    @register_analysis("customer_purchase_frequency", requires=("customer_summary",),
+                       approximate_requires=("sketches",))
+    def customer_purchase_frequency_analysis(self):
+        """Analyzing how frequently each customer makes a purchase"""
+        if self.approximate:
+            return self.sketches().top(self.sketches().customer_purchases, 10, "CustomerID", "TransactionID", "int64")
+        return self.top_customers("PurchaseCount", "TransactionID")
+
+    @register_analysis("distinct_customers", columns=("CustomerID",), approximate_requires=("sketches",))
+    def distinct_customers_analysis(self):
+        """Counting the distinct customers"""
+        if self.approximate:
+            return self.sketches().distinct_customers()
+        count = self.aggregates.customers.shape[0] if self.aggregates is not None else self.df["CustomerID"].nunique()
+        return pd.Series([count], index=["Distinct Customers"], name="CustomerID")
+
+    @register_analysis("purchase_value_quantiles", requires=("purchase_value_counts",),
+                       approximate_requires=("sketches",))
+    def purchase_value_quantiles_analysis(self):
+        """Analyzing the distribution of purchase values by quantile"""
+        if self.approximate:
+            return self.sketches().quantiles(self.PURCHASE_QUANTILES)
+        return quantiles_from_counts(self.purchase_value_counts(), self.PURCHASE_QUANTILES)
+
+    @register_analysis("customer_rfm", requires=("rfm",))
+    def customer_rfm_analysis(self):
+        """Scoring every customer's recency, frequency and monetary value by quintile and assigning a segment"""
+        return self.rfm()
+
+    @register_analysis("rfm_segments", requires=("rfm",))
+    def rfm_segments_analysis(self):
+        """Analyzing how customers and spend are distributed across RFM segments"""
+        return segment_summary(self.rfm())
+
+    @register_analysis("top_product_pairs", requires=("pair_engine",), approximate_requires=("sketches",))
+    def top_product_pairs_analysis(self, top_n=10, basket_key="CustomerID", **thresholds):
+        """Analyzing which products are most often bought by the same customer"""
+        try:
+            if self.approximate and basket_key == "CustomerID":
+                return self.sketches().top_pairs(top_n=top_n, **thresholds)
+            if basket_key == "CustomerID":
+                engine = self.pair_engine()
+            else:
+                engine = ProductPairEngine(self.df, basket_key=basket_key)
+            return engine.pairs(top_n=top_n, **thresholds)
+        except Exception as e:
+            report_error(f"Error in product pair analysis: {str(e)}")
+            return pd.DataFrame()
+
+    @register_analysis("sales_cube", requires=("cube",))
+    def sales_cube_analysis(self):
+        """Rollup cube behind the sales-by-dimension pages"""
+        return self.cube()
+
+    @register_analysis("product_search_index", requires=("cube",))
+    def product_search_index_analysis(self):
+        """Searchable product names with per-product totals from the cube"""
+        return ProductSearchIndex(self.cube())
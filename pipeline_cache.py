@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Bump whenever ingestion, processing or analysis output changes so stale entries are never served.
+PIPELINE_VERSION = "6"
+
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def content_hash(file) -> str:
+    """Hash the raw bytes of an upload, file object or path without consuming it"""
+    digest = hashlib.sha256()
+    if hasattr(file, "getvalue"):
+        digest.update(file.getvalue())
+    elif hasattr(file, "read"):
+        position = file.tell()
+        for block in iter(lambda: file.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block if isinstance(block, bytes) else block.encode())
+        file.seek(position)
+    else:
+        with open(file, "rb") as handle:
+            for block in iter(lambda: handle.read(_HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(file) -> str:
+    """Cache key for a dataset: pipeline version plus the content hash of its source"""
+    return f"{PIPELINE_VERSION}:{content_hash(file)}"
+
+
+def appended_key(key, batch_ids) -> str:
+    """Cache key for a dataset with appended batches: the base key plus a hash of the batch ids in the order
+    they were appended, since the first batch holding a TransactionID is the one kept"""
+    digest = hashlib.sha256("\n".join(batch_ids).encode()).hexdigest()
+    return f"{key}+{digest}"
+
+
+def derives_from(key, base) -> bool:
+    """Whether key is base itself or base with appended batches"""
+    return key == base or (isinstance(key, str) and key.startswith(f"{base}+"))
+
+
+def estimate_nbytes(value, seen=None) -> int:
+    """Rough in-memory size of a cached value, counting DataFrame buffers deeply.
+
+    Objects reachable more than once, e.g. a frame held by both an analysis and its results, count once."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    # Copied first, since background jobs may add results or intermediates while the entry is measured
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(item, seen) for item in list(value.values()))
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item, seen) for item in list(value))
+    if hasattr(value, "__dict__"):
+        return estimate_nbytes(dict(vars(value)), seen)
+    return sys.getsizeof(value)
+
+
+# LRU cache for pipeline results shared across reruns
+class PipelineCache:
+    def __init__(self, max_entries: int = 8, max_bytes: int = 2 * 1024 ** 3):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key (marking it most recently used) or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def peek(self, key):
+        """Return the cached value for key without touching recency or hit statistics"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, value, nbytes: int = None):
+        """Store a value and evict least recently used entries beyond the memory budget"""
+        nbytes = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            self._entries[key] = (value, nbytes)
+            self._entries.move_to_end(key)
+            self._evict()
+        return value
+
+    def remeasure(self, key):
+        """Re-estimate an entry whose value has grown, e.g. as lazy results and views land, and evict
+        least recently used entries if it pushed the cache over budget"""
+        value = self.peek(key)
+        if value is None:
+            return
+        nbytes = estimate_nbytes(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is value:
+                self._entries[key] = (value, nbytes)
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries beyond the entry and memory budgets; call with the lock held"""
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            evicted, _ = self._entries.popitem(last=False)
+            logging.info(f"Evicted cached pipeline results for {evicted}.")
+
+    def invalidate(self, key) -> bool:
+        """Drop an entry and those of the same dataset with appended batches, returning whether any was present"""
+        with self._lock:
+            stale = [cached for cached in self._entries if derives_from(cached, key)]
+            for cached in stale:
+                del self._entries[cached]
+        return bool(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._entries.values())
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
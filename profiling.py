@@ -0,0 +1,130 @@
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# Structured per-stage records go to this logger; each LogRecord carries the stage dict as record.stage_record
+stage_logger = logging.getLogger("pipeline.stages")
+
+# tracemalloc makes allocation-heavy stages several times slower, so per-stage peaks are opt-in with
+# DASHBOARD_TRACE_MEMORY=1; the process high-water mark (max_rss_mb) is always recorded
+TRACE_MEMORY = os.environ.get("DASHBOARD_TRACE_MEMORY", "0") == "1"
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Absolute traced peaks of the measure() calls currently open, one stack per thread, so nested stages do
+# not hide their parent's peak. tracemalloc's peak is process-wide, so every reset folds it into the
+# innermost open stage of every thread first; all of this state is guarded by _tracing_lock.
+_tracing_lock = threading.Lock()
+_open_peaks = {}
+# Set when measure() turned tracing on; it is turned off again once no thread has a stage open
+_started_tracing = False
+
+
+@contextmanager
+def measure(stage: str, records: list, rows_in: int = None, trace_memory: bool = True):
+    """Time a pipeline step and record its peak traced memory; the caller may set record["rows_out"].
+
+    Tracing slows allocation-heavy code, so pass trace_memory=False for timing-only runs. Memory is
+    shared by all threads, so a stage's peak includes whatever concurrent stages allocated meanwhile."""
+    global _started_tracing
+    record = {"stage": stage, "rows_in": rows_in, "rows_out": None}
+    if trace_memory:
+        with _tracing_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            for peaks in _open_peaks.values():
+                peaks[-1] = max(peaks[-1], peak)
+            _open_peaks.setdefault(threading.get_ident(), []).append(current)
+            tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        record["peak_mb"] = None
+        if trace_memory:
+            with _tracing_lock:
+                peaks = _open_peaks[threading.get_ident()]
+                peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if peaks:
+                    peaks[-1] = max(peaks[-1], peak)
+                else:
+                    del _open_peaks[threading.get_ident()]
+                if not _open_peaks and _started_tracing:
+                    tracemalloc.stop()
+                    _started_tracing = False
+            record["peak_mb"] = max(peak - current, 0) / 1024 ** 2
+        records.append(record)
+
+
+# Bounded, thread-safe log of recent stage records, read by the dashboard's diagnostics page
+class StageLog:
+    def __init__(self, max_records: int = 500):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def append(self, record: dict):
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> list:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+stage_log = StageLog()
+
+
+@contextmanager
+def instrument(stage: str, rows_in: int = None, records: list = None, **fields):
+    """Measure a stage and emit it as a structured log record and into stage_log.
+
+    Extra fields such as cache="hit" are attached to the record; the caller may set
+    record["rows_out"] or change fields inside the block."""
+    measured = []
+    try:
+        with measure(stage, measured, rows_in, TRACE_MEMORY) as record:
+            record.update(fields)
+            yield record
+    finally:
+        record = measured[0]
+        record["max_rss_mb"] = max_rss_mb()
+        record["timestamp"] = time.time()
+        stage_log.append(record)
+        if records is not None:
+            records.append(record)
+        stage_logger.info(
+            " ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                     for key, value in record.items() if key != "timestamp" and value is not None),
+            extra={"stage_record": record})
+
+
+def result_rows(result):
+    """Row count of an analysis result for stage records, None when it has no length"""
+    try:
+        return len(getattr(result, "cells", result))
+    except TypeError:
+        return None
+
+
+def max_rss_mb():
+    """Peak resident set size of this process so far, None where the platform does not report it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+RFM_COLUMNS = ["Recency", "Frequency", "Monetary", "R", "F", "M", "Segment"]
+
+SEGMENTS = ["Champions", "Loyal Customers", "Potential Loyalists", "New Customers", "Promising",
+            "Need Attention", "About to Sleep", "At Risk", "Can't Lose", "Hibernating"]
+
+# Segment by recency score (rows, 1-5) and combined frequency/monetary score (columns, 1-5)
+SEGMENT_GRID = [
+    ["Hibernating", "Hibernating", "At Risk", "At Risk", "Can't Lose"],
+    ["Hibernating", "Hibernating", "At Risk", "At Risk", "Can't Lose"],
+    ["About to Sleep", "About to Sleep", "Need Attention", "Loyal Customers", "Loyal Customers"],
+    ["Promising", "Potential Loyalists", "Potential Loyalists", "Loyal Customers", "Loyal Customers"],
+    ["New Customers", "Potential Loyalists", "Potential Loyalists", "Champions", "Champions"],
+]
+_SEGMENT_CODES = np.array([[SEGMENTS.index(segment) for segment in row] for row in SEGMENT_GRID], dtype=np.int8)
+
+
+def quantile_scores(values: np.ndarray, bins: int = 5) -> np.ndarray:
+    """Scores 1..bins by quantile of values, higher values scoring higher; ties share a score.
+
+    One selection pass for the edges and one binary search per value, so no sort of the whole column."""
+    if not len(values):
+        return np.zeros(0, dtype=np.int8)
+    edges = np.quantile(values, np.arange(1, bins) / bins)
+    return (np.searchsorted(edges, values, side="left") + 1).astype(np.int8)
+
+
+def rfm_table(customers: pd.DataFrame, reference=None, bins: int = 5) -> pd.DataFrame:
+    """Recency, frequency and monetary values, their quantile scores and segment for every customer.
+
+    customers has one row per customer with LastPurchase, PurchaseCount and TotalSpend, as in
+    DataAnalysisModule.customer_summary(); recency is counted in days before reference, by default
+    the day after the last purchase in the data."""
+    last_purchase = customers["LastPurchase"]
+    if reference is None:
+        reference = last_purchase.max() + pd.Timedelta(days=1) if len(customers) else pd.Timestamp(0)
+    # A later last purchase is a smaller recency and a better score
+    r = quantile_scores(last_purchase.to_numpy(dtype="datetime64[ns]").view("int64"), bins)
+    f = quantile_scores(customers["PurchaseCount"].to_numpy(), bins)
+    m = quantile_scores(customers["TotalSpend"].to_numpy(dtype="float64"), bins)
+    fm = (f.astype(np.int16) + m + 1) // 2
+    # Grid rows and columns are on a 1-5 scale whatever the number of bins
+    grid = lambda scores: (scores.astype(np.int16) - 1) * 5 // bins
+    segments = _SEGMENT_CODES[grid(r), grid(fm)]
+    return pd.DataFrame({
+        "Recency": (reference - last_purchase).dt.days,
+        "Frequency": customers["PurchaseCount"],
+        "Monetary": customers["TotalSpend"],
+        "R": r,
+        "F": f,
+        "M": m,
+        "Segment": pd.Categorical.from_codes(segments, SEGMENTS),
+    }, index=customers.index)
+
+
+def segment_summary(rfm: pd.DataFrame) -> pd.DataFrame:
+    """Customer count, share, mean recency and frequency and total spend of each segment, in SEGMENTS order"""
+    grouped = rfm.groupby("Segment", observed=False)
+    summary = grouped.agg(
+        Customers=("Recency", "size"),
+        AverageRecency=("Recency", "mean"),
+        AverageFrequency=("Frequency", "mean"),
+        TotalSpend=("Monetary", "sum"),
+    )
+    summary.insert(1, "Share", summary["Customers"] / max(len(rfm), 1))
+    return summary
@@ -0,0 +1,215 @@
+"""Mergeable streaming sketches whose memory does not grow with the number of rows folded in."""
+import numpy as np
+import pandas as pd
+
+
+def hash_keys(keys) -> np.ndarray:
+    """64-bit hashes of arbitrary keys, stable across processes"""
+    return pd.util.hash_array(np.asarray(keys, dtype=object))
+
+
+# Count-Min sketch of total weight per key
+class CountMinSketch:
+    def __init__(self, width: int = 2 ** 14, depth: int = 4, seed: int = 0):
+        """Each estimate overestimates the true weight by at most e / width of the total weight,
+        with probability at least 1 - exp(-depth); width must be a power of two"""
+        if width & (width - 1):
+            raise ValueError("width must be a power of two")
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width))
+        self.total = 0.0
+        # Multiply-shift hashing of the 64-bit key hash, one odd multiplier per row
+        self.multipliers = np.random.default_rng(seed).integers(1, 2 ** 63, depth, dtype=np.uint64) | np.uint64(1)
+        self._shift = np.uint64(64 - width.bit_length() + 1)
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        return ((hashes[None, :] * self.multipliers[:, None]) >> self._shift).astype(np.intp)
+
+    def add(self, keys, weights=None):
+        hashes = hash_keys(keys)
+        weights = np.ones(len(hashes)) if weights is None else np.asarray(weights, dtype="float64")
+        for row, columns in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(columns, weights, minlength=self.width)
+        self.total += weights.sum()
+        return self
+
+    def estimate(self, keys) -> np.ndarray:
+        columns = self._columns(hash_keys(keys))
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge(self, other: "CountMinSketch"):
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    @property
+    def error_bound(self) -> float:
+        return np.e / self.width * self.total
+
+    @property
+    def confidence(self) -> float:
+        return 1 - np.exp(-self.depth)
+
+
+# Mergeable Space-Saving summary of the heaviest keys by total weight
+class SpaceSaving:
+    def __init__(self, capacity: int = 1000):
+        """Keeps at most capacity counters. counts are upper bounds of each kept key's weight and
+        counts - errors lower bounds; any key not kept weighs at most floor."""
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="float64")
+        self.errors = pd.Series(dtype="float64")
+        self.floor = 0.0
+        self.total = 0.0
+
+    def add(self, keys, weights=None):
+        """Fold a batch in: its exact per-key totals are a summary of their own, merged into this one"""
+        keys = np.asarray(keys, dtype=object)
+        weights = np.ones(len(keys)) if weights is None else np.asarray(weights, dtype="float64")
+        batch = SpaceSaving(self.capacity)
+        batch.total = weights.sum()
+        batch._truncate(pd.Series(weights).groupby(keys).sum(), None, 0.0)
+        return self.merge(batch)
+
+    def merge(self, other: "SpaceSaving"):
+        index = self.counts.index.union(other.counts.index)
+        counts = self.counts.reindex(index, fill_value=self.floor) + other.counts.reindex(index, fill_value=other.floor)
+        errors = self.errors.reindex(index, fill_value=self.floor) + other.errors.reindex(index, fill_value=other.floor)
+        self.total += other.total
+        self._truncate(counts, errors, self.floor + other.floor)
+        return self
+
+    def _truncate(self, counts: pd.Series, errors, floor: float):
+        if errors is None:
+            errors = pd.Series(0.0, index=counts.index)
+        if len(counts) > self.capacity:
+            ranked = counts.sort_values(ascending=False, kind="stable")
+            # A dropped key's weight is bounded by the largest dropped count
+            floor = max(floor, ranked.iloc[self.capacity])
+            kept = ranked.index[:self.capacity]
+            counts, errors = counts[kept], errors[kept]
+        self.counts, self.errors, self.floor = counts, errors, floor
+
+
+# Space-Saving candidates with their counts tightened by a Count-Min sketch of the same stream
+class HeavyHitters:
+    def __init__(self, capacity: int = 1000, width: int = 2 ** 14, depth: int = 4):
+        self.summary = SpaceSaving(capacity)
+        self.sketch = CountMinSketch(width, depth)
+
+    def add(self, keys, weights=None):
+        self.summary.add(keys, weights)
+        self.sketch.add(keys, weights)
+        return self
+
+    def merge(self, other: "HeavyHitters"):
+        self.summary.merge(other.summary)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def estimate(self, keys) -> np.ndarray:
+        """Upper-bound weight estimates; exact for keys whose Space-Saving error is zero"""
+        keys = np.asarray(keys, dtype=object)
+        estimates = self.sketch.estimate(keys)
+        counts = self.summary.counts.reindex(keys).to_numpy()
+        return np.where(np.isnan(counts), estimates, np.fmin(counts, estimates))
+
+    def top(self, n: int):
+        """The n heaviest keys with their estimates and the largest possible overestimate among them"""
+        counts = self.summary.counts
+        if not len(counts):
+            return pd.Series(dtype="float64"), 0.0
+        estimates = pd.Series(np.fmin(counts.to_numpy(), self.sketch.estimate(counts.index)), index=counts.index)
+        top = estimates.sort_values(ascending=False, kind="stable").head(n)
+        lower = (counts - self.summary.errors)[top.index]
+        return top, float((top - lower).max())
+
+
+# HyperLogLog distinct counter
+class HyperLogLog:
+    def __init__(self, precision: int = 14):
+        """Relative standard error 1.04 / sqrt(2 ** precision), about 0.8% at the default precision"""
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, keys):
+        hashes = hash_keys(keys)
+        buckets = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        # The remaining bits fit a float64 exactly, so frexp gives their leading-zero count
+        rest_bits = 64 - self.precision
+        rest = (hashes & np.uint64((1 << rest_bits) - 1)).astype("float64")
+        _, exponent = np.frexp(rest)
+        ranks = np.where(rest > 0, rest_bits - exponent + 1, rest_bits + 1).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+        return self
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def count(self) -> float:
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype("float64")))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+
+# Merging t-digest for quantiles
+class TDigest:
+    def __init__(self, compression: int = 200):
+        """Keeps at most about compression / 2 centroids, with smaller ones at the tails. Quantile
+        estimates are typically within 1 / compression in rank; min and max are exact."""
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values, weights=None):
+        values = np.asarray(values, dtype="float64")
+        if not len(values):
+            return self
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype="float64")
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, weights]))
+        return self
+
+    def merge(self, other: "TDigest"):
+        if len(other.means):
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means, weights):
+        """Group points whose k1 scale values k(q) = compression / (2 pi) * asin(2q - 1) share an integer part"""
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        scale = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        _, groups = np.unique(np.floor(scale), return_inverse=True)
+        merged_weights = np.bincount(groups, weights)
+        self.means = np.bincount(groups, weights * means) / merged_weights
+        self.weights = merged_weights
+
+    def quantile(self, q: float) -> float:
+        if not len(self.means):
+            return np.nan
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centers, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * total, positions, values))
+
+    @property
+    def total(self) -> float:
+        return float(self.weights.sum())
@@ -0,0 +1,108 @@
+"""Append-friendly lookup structures whose total merge cost stays O(n log n) however many batches are added.
+
+Each batch becomes a new run; runs of similar size are merged as they accumulate, like the levels of
+a log-structured merge tree, so no batch copies the whole history. Runs are never modified in place,
+so copy() shares them."""
+import numpy as np
+import pandas as pd
+
+
+def compact_runs(runs: list, merge):
+    """Merge trailing runs with merge(left, right) until each run is more than twice the size of the next"""
+    while len(runs) > 1 and len(runs[-2]) <= 2 * len(runs[-1]):
+        right = runs.pop()
+        runs[-1] = merge(runs[-1], right)
+
+
+def gather_ranges(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Positions lo[0]..hi[0]-1, lo[1]..hi[1]-1, ... concatenated"""
+    counts = hi - lo
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return starts + np.arange(counts.sum())
+
+
+# Set of integer keys kept as sorted, disjoint runs
+class SortedRuns:
+    def __init__(self, dtype=np.uint64):
+        self.dtype = dtype
+        self.runs = []
+
+    def contains(self, values: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(values), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, values), len(run) - 1)
+            found |= run[positions] == values
+        return found
+
+    def add(self, values: np.ndarray):
+        """Add values, ignoring any already present"""
+        new = np.unique(np.asarray(values, dtype=self.dtype))
+        new = new[~self.contains(new)]
+        if len(new):
+            self.runs.append(new)
+            compact_runs(self.runs, lambda left, right: np.sort(np.concatenate([left, right]), kind="stable"))
+        return self
+
+    def within(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """Values v with lo[i] <= v < hi[i] for some i, given sorted, non-overlapping ranges"""
+        parts = [run[gather_ranges(np.searchsorted(run, lo), np.searchsorted(run, hi))] for run in self.runs]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    def values(self) -> np.ndarray:
+        """Every value, sorted; the runs are merged into one"""
+        if len(self.runs) > 1:
+            self.runs = [np.sort(np.concatenate(self.runs), kind="stable")]
+        return self.runs[0] if self.runs else np.empty(0, dtype=self.dtype)
+
+    def copy(self) -> "SortedRuns":
+        copy = SortedRuns(self.dtype)
+        copy.runs = list(self.runs)
+        return copy
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+
+# Append-only mapping of keys to consecutive integer codes, in order of first appearance
+class KeyCodes:
+    def __init__(self, empty: pd.Index):
+        """empty is a zero-length Index of the key type, e.g. a MultiIndex for composite keys"""
+        self.runs = [empty]
+        self.offsets = [0]
+
+    def get_indexer(self, keys: pd.Index) -> np.ndarray:
+        """Codes of keys, -1 for keys never appended"""
+        codes = np.full(len(keys), -1, dtype=np.int64)
+        for run, offset in zip(self.runs, self.offsets):
+            positions = run.get_indexer(keys)
+            found = positions >= 0
+            codes[found] = positions[found] + offset
+        return codes
+
+    def append(self, keys: pd.Index):
+        """Give new, distinct keys the next codes"""
+        if len(keys):
+            self.runs.append(keys)
+            self.offsets.append(self.offsets[-1] + len(self.runs[-2]))
+            while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+                right = self.runs.pop()
+                self.offsets.pop()
+                self.runs[-1] = self.runs[-1].append(right)
+        return self
+
+    def index(self) -> pd.Index:
+        """Every key, in code order"""
+        if len(self.runs) > 1:
+            merged = self.runs[0]
+            for run in self.runs[1:]:
+                merged = merged.append(run)
+            self.runs, self.offsets = [merged], [0]
+        return self.runs[0]
+
+    def copy(self) -> "KeyCodes":
+        copy = KeyCodes(self.runs[0])
+        copy.runs, copy.offsets = list(self.runs), list(self.offsets)
+        return copy
+
+    def __len__(self):
+        return self.offsets[-1] + len(self.runs[-1])
@@ -1,7 +1,46 @@
+import functools
+import io
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
 import pandas as pd
 import numpy as np
-from main import DataProcessingModule, DataAnalysisModule
+from pipeline import DataIngestionModule, DataProcessingModule, DataAnalysisModule
+from basket_engine import ProductPairEngine
+from columnar_cache import ColumnarCache
+from pipeline import DateIndex, SalesFilter
+from pipeline_cache import PipelineCache, cache_key, content_hash
+
+ENHANCED_CSV = "supermarket_sales_enhanced.csv"
+
+
+@functools.lru_cache(maxsize=None)
+def ingested(path=ENHANCED_CSV) -> pd.DataFrame:
+    """The CSV as ingested, read once per test run; tests must not modify it"""
+    return DataIngestionModule.load_data(path)
+
+
+@functools.lru_cache(maxsize=None)
+def processed(path=ENHANCED_CSV) -> pd.DataFrame:
+    """The CSV ingested and processed, once per test run; tests must not modify it"""
+    return DataProcessingModule(ingested(path)).process_data()
+
+
+def assert_results_equal(result, expected, names=None, check_names=True):
+    """Assert that the named analysis results, all of expected's by default, match; cubes are compared
+    by their cells and search indexes by their product table"""
+    for name in names or list(expected):
+        actual, wanted = result[name], expected[name]
+        if hasattr(wanted, "cells"):
+            pd.testing.assert_frame_equal(actual.cells, wanted.cells)
+        elif hasattr(wanted, "product_table"):
+            pd.testing.assert_frame_equal(actual.product_table, wanted.product_table)
+        elif isinstance(wanted, pd.DataFrame):
+            pd.testing.assert_frame_equal(actual, wanted)
+        else:
+            pd.testing.assert_series_equal(actual, wanted, check_names=check_names)
 
 
 class TestSalesDashboard(unittest.TestCase):
@@ -101,6 +140,25 @@ class TestSalesDashboard(unittest.TestCase):
         self.assertIsInstance(result, pd.Series)
         self.assertTrue(all(v > 0 for v in result.values))
 
+    def test_analysis_results_are_computed_lazily(self):
+        """Test that analyze() defers each result until it is first accessed and memoizes it"""
+        result = self.analysis_module.analyze()
+        self.assertIn("top_product_pairs", result)
+        self.assertFalse(result.is_computed("top_product_pairs"))
+        regional = result["regional_sales"]
+        self.assertFalse(result.is_computed("top_product_pairs"))
+        self.assertIs(result["regional_sales"], regional)
+
+    def test_customer_metrics_share_one_summary(self):
+        """Test that the customer metrics match individual groupbys and reuse one summary table"""
+        by_customer = self.processed_df.groupby("CustomerID")
+        summary = self.analysis_module.customer_summary()
+        self.assertIs(self.analysis_module.customer_summary(), summary)
+        self.assertEqual(list(self.analysis_module.frequent_customers_analysis().values),
+                         list(by_customer["TotalPrice"].sum().nlargest(10).values))
+        self.assertEqual(list(self.analysis_module.customer_purchase_frequency_analysis().values),
+                         list(by_customer["TransactionID"].count().nlargest(10).values))
+
     def test_customer_recency_valid(self):
         """Test that the most recent customer ID is not empty when converted to string"""
         result = self.analysis_module.customer_recency_analysis()
@@ -108,5 +166,997 @@ class TestSalesDashboard(unittest.TestCase):
         self.assertTrue(recent_customer.strip() != "")
 
 
+class TestProductPairEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = DataProcessingModule(pd.read_csv(ENHANCED_CSV)).process_data()
+
+    def test_top_pairs_match_combination_counting(self):
+        """Test that the sparse engine returns the same top 10 pairs as counting combinations per customer"""
+        from collections import Counter
+        from itertools import combinations
+        counter = Counter()
+        for products in self.df.groupby("CustomerID")["ProductName"].apply(list):
+            counter.update(combinations(sorted(set(products)), 2))
+        expected = sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+        result = DataAnalysisModule(self.df).top_product_pairs_analysis()
+        self.assertEqual(list(zip(result["Product Pair"], result["Frequency"])), expected)
+
+    def test_thresholds_filter_pairs(self):
+        """Test that support and lift thresholds only keep pairs meeting them"""
+        engine = ProductPairEngine(self.df)
+        pairs = engine.pairs(top_n=None, min_support=0.18, min_lift=1.0)
+        self.assertTrue((pairs["Support"] >= 0.18).all())
+        self.assertTrue((pairs["Lift"] >= 1.0).all())
+        self.assertLess(len(pairs), len(engine.pairs(top_n=None)))
+
+    def test_incremental_add_matches_full_build(self):
+        """Test that adding purchases, including unseen products, gives the same pairs as building at once"""
+        df = self.df.assign(ProductName=self.df["ProductName"].astype(str))
+        df.loc[df.index[-300:], "ProductName"] = "Avocado"
+        engine = ProductPairEngine(df.iloc[:6000]).add(df.iloc[6000:])
+        pd.testing.assert_frame_equal(engine.pairs(top_n=None), ProductPairEngine(df).pairs(top_n=None))
+
+    def test_transaction_baskets_have_no_pairs_for_single_item_transactions(self):
+        """Test that per-transaction baskets with one product each produce no pairs"""
+        pairs = ProductPairEngine(self.df, basket_key="TransactionID").pairs()
+        self.assertTrue(pairs.empty)
+
+
+class TestStreamingIngestion(unittest.TestCase):
+
+    def test_streamed_results_match_in_memory_results(self):
+        """Test that chunked ingestion with cross-chunk duplicates gives the in-memory analysis results"""
+        data = pd.read_csv("supermarket_sales.csv")
+        with_duplicates = pd.concat([data, data.iloc[:50], data.iloc[[7]]])
+        csv = with_duplicates.to_csv(index=False)
+
+        raw = DataIngestionModule.load_data(io.StringIO(csv))
+        expected = DataAnalysisModule(DataProcessingModule(raw).process_data()).analyze()
+        aggregates = DataIngestionModule.load_aggregates(io.StringIO(csv), chunksize=64)
+        streamed = DataAnalysisModule.from_aggregates(aggregates).analyze()
+
+        self.assertEqual(aggregates.rows, len(data))
+        assert_results_equal(streamed, expected, check_names=False)
+
+    def test_sorted_runs_stay_logarithmic_and_exact(self):
+        """Test that many small batches keep few runs and membership, ranges and codes match a plain set"""
+        from sorted_runs import KeyCodes, SortedRuns
+        rng = np.random.default_rng(5)
+        runs, codes, added = SortedRuns(np.int64), KeyCodes(pd.Index([], dtype="int64")), set()
+        for _ in range(200):
+            batch = rng.integers(0, 50_000, 100)
+            runs.add(batch)
+            codes.append(pd.Index(np.unique(batch)).difference(pd.Index(sorted(added)), sort=False))
+            added.update(batch.tolist())
+        self.assertLessEqual(len(runs.runs), np.log2(len(added)) + 1)
+        self.assertEqual(len(runs), len(added))
+        probe = np.arange(50_000)
+        np.testing.assert_array_equal(runs.contains(probe), np.isin(probe, list(added)))
+        np.testing.assert_array_equal(np.sort(runs.within(np.array([100, 2000]), np.array([500, 2600]))),
+                                      sorted(v for v in added if 100 <= v < 500 or 2000 <= v < 2600))
+        self.assertEqual(sorted(codes.get_indexer(codes.index())), list(range(len(added))))
+        np.testing.assert_array_equal(runs.values(), sorted(added))
+
+
+class TestDataProcessing(unittest.TestCase):
+
+    def setUp(self):
+        self.data = pd.read_csv("supermarket_sales.csv")
+
+    def test_process_data_leaves_input_untouched(self):
+        """Test that processing returns a new frame and does not modify the caller's frame"""
+        original = self.data.copy()
+        DataProcessingModule(self.data).process_data()
+        pd.testing.assert_frame_equal(self.data, original)
+
+    def test_dedup_key_drops_repeated_transactions(self):
+        """Test that a dedup key drops rows repeating a TransactionID even when other columns differ"""
+        repeated = self.data.iloc[:3].assign(Quantity=99)
+        data = pd.concat([self.data, repeated], ignore_index=True)
+        self.assertEqual(len(DataProcessingModule(data, dedup_key="TransactionID").process_data()), len(self.data))
+        self.assertEqual(len(DataProcessingModule(data).process_data()), len(self.data) + 3)
+
+    def test_inconsistent_total_price_is_corrected(self):
+        """Test that only totals disagreeing with Quantity * PriceperUnit are replaced"""
+        data = self.data.copy()
+        data.loc[0, "TotalPrice"] = 1000
+        processor = DataProcessingModule(data)
+        processed = processor.process_data()
+        self.assertEqual(processed.loc[0, "TotalPrice"], data.loc[0, "Quantity"] * data.loc[0, "PriceperUnit"])
+        self.assertEqual([record["stage"] for record in processor.report],
+                         ["parse_dates", "drop_duplicates", "dropna", "total_price"])
+        self.assertTrue(all(record["seconds"] >= 0 for record in processor.report))
+
+
+class TestSalesCube(unittest.TestCase):
+
+    def test_cube_totals_match_row_level_groupbys(self):
+        """Test that summing cube cells gives the same totals as grouping the raw rows"""
+        df = processed()
+        cube = DataAnalysisModule(df).cube()
+        pd.testing.assert_series_equal(cube.totals("Region"),
+                                       df.groupby("Region", observed=True)["TotalPrice"].sum())
+        self.assertEqual(cube.grand_total("Transactions"), len(df))
+        dairy = df[df["ProductName"].isin(["Milk", "Cheese"])]
+        monthly = dairy.groupby(dairy["Date"].dt.to_period("M"))["TotalPrice"].sum()
+        pd.testing.assert_series_equal(cube.totals("Month", products=["Milk", "Cheese"]), monthly,
+                                       check_index_type=False, check_names=False)
+
+
+class TestProductSearchIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = processed()
+        cls.index = DataAnalysisModule(cls.df).analyze()["product_search_index"]
+
+    def test_search_matches_substring_scan(self):
+        """Test that index lookups find the same products as a case-insensitive substring scan"""
+        names = pd.Series(self.df["ProductName"].astype(str).unique())
+        for term in ["ch", "CHEESE", "e", "read", "xyz"]:
+            expected = sorted(names[names.str.lower().str.contains(term.lower(), regex=False)])
+            self.assertEqual(sorted(self.index.matching_names(self.index.search(term))), expected)
+
+    def test_aggregates_match_matching_rows(self):
+        """Test that precomputed per-product aggregates equal grouping the matching rows"""
+        codes = self.index.search("ch")
+        rows = self.df[self.df["ProductName"].isin(self.index.matching_names(codes))]
+        total_sales, total_quantity = self.index.totals(codes)
+        self.assertAlmostEqual(total_sales, rows["TotalPrice"].sum())
+        self.assertEqual(total_quantity, rows["Quantity"].sum())
+        regional = rows.groupby("Region", observed=True)["TotalPrice"].sum().sort_values(ascending=False)
+        self.assertEqual(list(self.index.regional(codes).index), list(regional.index.astype(str)))
+        self.assertAlmostEqual(self.index.monthly(codes).sum(), rows["TotalPrice"].sum())
+
+
+class TestIncrementalAppend(unittest.TestCase):
+
+    ANALYSES = ["best_selling_products", "monthly_sales", "regional_sales", "sales_by_day", "frequent_customers",
+                "average_purchase_value", "customer_recency", "customer_purchase_frequency", "top_product_pairs"]
+
+    def test_appended_batches_match_full_recompute(self):
+        """Test that appending overlapping daily batches gives the same results as analysing all rows at once"""
+        data = ingested()
+        expected = DataAnalysisModule(processed()).analyze()
+
+        analysis = DataAnalysisModule(DataProcessingModule(data.iloc[:8000]).process_data())
+        self.assertTrue(analysis.append(data.iloc[7900:9500], batch_id="day-1"))
+        self.assertTrue(analysis.append(data.iloc[9400:], batch_id="day-2"))
+        self.assertFalse(analysis.append(data.iloc[9400:], batch_id="day-2"))
+        result = analysis.analyze()
+
+        self.assertEqual(analysis.aggregates.rows, len(data))
+        assert_results_equal(result, expected, self.ANALYSES, check_names=False)
+
+
+    def test_batches_without_required_columns_are_reported_and_skipped(self):
+        """Test that malformed, header-only and incomplete batches leave the analysis unchanged"""
+        import pipeline
+        reported = []
+        pipeline.set_error_handler(reported.append)
+        self.addCleanup(pipeline.set_error_handler, None)
+        data = ingested()
+        analysis = DataAnalysisModule(DataProcessingModule(data.iloc[:8000]).process_data())
+        expected = DataAnalysisModule(DataProcessingModule(data.iloc[:8000]).process_data()).analyze()
+        malformed = DataIngestionModule.load_data(io.StringIO("not,a\nsales,\"file"))
+        self.assertFalse(analysis.append(malformed, batch_id="malformed"))
+        self.assertFalse(analysis.append(data.iloc[8000:8100].drop(columns="Region"), batch_id="no-region"))
+        self.assertTrue(any("missing columns Region" in message for message in reported))
+        self.assertNotIn("no-region", analysis.applied_batches)
+        self.assertTrue(analysis.append(data.iloc[:0], batch_id="header-only"))
+        assert_results_equal(analysis.analyze(), expected, self.ANALYSES)
+
+    def test_copies_append_without_touching_the_shared_state(self):
+        """Test that appending to a copy reuses the base intermediates and leaves the base results unchanged"""
+        data = ingested()
+        base = DataAnalysisModule(DataProcessingModule(data.iloc[:8000]).process_data())
+        before = base.analyze()
+        cube, customers = before["sales_cube"].cells.copy(), before["frequent_customers"]
+        base.date_index()
+
+        appended = base.copy()
+        with self.assertLogs("pipeline.stages", level="INFO") as logs:
+            self.assertTrue(appended.append(data.iloc[8000:], batch_id="day-1"))
+        stages = [log.stage_record["stage"] for log in logs.records]
+        self.assertNotIn("intermediate:cube", stages)
+        self.assertNotIn("intermediate:pair_engine", stages)
+
+        self.assertEqual(base.applied_batches, set())
+        pd.testing.assert_frame_equal(base.analyze()["sales_cube"].cells, cube)
+        pd.testing.assert_series_equal(base.analyze()["frequent_customers"], customers)
+        self.assertEqual(len(appended.date_index().frame), len(data))
+        self.assertEqual(appended.aggregates.rows, len(data))
+
+        appended.update(processed())
+        self.assertTrue(appended.append(data.iloc[8000:], batch_id="day-1"))
+
+    def test_copies_share_state_and_append_runs(self):
+        """Test that a copy shares the base runs and an append adds runs instead of rewriting them"""
+        data = ingested()
+        base = DataAnalysisModule(DataProcessingModule(data.iloc[:8000]).process_data())
+        state = base.base_aggregates()
+        appended = base.copy()
+        self.assertIs(appended.aggregates.cube.runs[0], state.cube.runs[0])
+        self.assertIs(appended.aggregates.customer_runs[0], state.customer_runs[0])
+        appended.append(data.iloc[8000:8050], batch_id="day-1")
+        self.assertIs(appended.aggregates.cube.runs[0], state.cube.runs[0])
+        self.assertIs(appended.aggregates.customer_runs[0], state.customer_runs[0])
+        self.assertEqual(len(state.cube.runs), 1)
+        self.assertEqual(len(appended.aggregates.cube.runs), 2)
+        self.assertNotIn("customer_summary", appended._intermediates)
+
+
+class TestCustomerRFM(unittest.TestCase):
+
+    def test_scores_follow_quintiles_and_segments_follow_the_grid(self):
+        """Test that R/F/M scores are quintiles of last purchase, purchase count and spend and segments use the grid"""
+        from rfm import SEGMENT_GRID, rfm_table, segment_summary
+        rng = np.random.default_rng(3)
+        customers = pd.DataFrame({
+            "TotalSpend": rng.gamma(2, 50, 10_000),
+            "PurchaseCount": rng.geometric(0.3, 10_000),
+            "LastPurchase": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365, 10_000), unit="D"),
+        }, index=pd.Index(np.arange(10_000), name="CustomerID"))
+        rfm = rfm_table(customers)
+
+        self.assertEqual(rfm["Recency"].min(), 1)
+        self.assertEqual((pd.qcut(rfm["Monetary"], 5, labels=False) + 1).tolist(), rfm["M"].tolist())
+        for column in ["R", "F", "M"]:
+            self.assertEqual(sorted(rfm[column].unique()), [1, 2, 3, 4, 5])
+        # Scores never decrease as the value improves
+        self.assertTrue(rfm.sort_values("Frequency")["F"].is_monotonic_increasing)
+        self.assertTrue(rfm.sort_values("Recency", ascending=False)["R"].is_monotonic_increasing)
+        expected = [SEGMENT_GRID[r - 1][(f + m + 1) // 2 - 1] for r, f, m in zip(rfm["R"], rfm["F"], rfm["M"])]
+        self.assertEqual(rfm["Segment"].astype(str).tolist(), expected)
+
+        summary = segment_summary(rfm)
+        self.assertEqual(summary["Customers"].sum(), len(customers))
+        self.assertAlmostEqual(summary["TotalSpend"].sum(), customers["TotalSpend"].sum())
+
+    def test_appended_batches_rescore_like_a_full_recompute(self):
+        """Test that RFM results after appending batches equal those of analysing every row at once"""
+        data = ingested()
+        expected = DataAnalysisModule(processed()).analyze()
+        analysis = DataAnalysisModule(DataProcessingModule(data.iloc[:8000]).process_data())
+        before = analysis.analyze()["customer_rfm"]
+        analysis.append(data.iloc[7900:], batch_id="day-1")
+        result = analysis.analyze()
+
+        self.assertIsNot(result["customer_rfm"], before)
+        pd.testing.assert_frame_equal(result["customer_rfm"], expected["customer_rfm"])
+        pd.testing.assert_frame_equal(result["rfm_segments"], expected["rfm_segments"])
+
+
+class TestSalesFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.data = processed()
+        self.sales_filter = SalesFilter(start=pd.Timestamp("2023-01-01"), end=pd.Timestamp("2023-03-31"),
+                                        regions=("Colombo", "Kandy"))
+        self.mask = (self.data["Date"].between("2023-01-01", "2023-03-31")
+                     & self.data["Region"].isin(["Colombo", "Kandy"]))
+
+    def test_date_index_selects_the_same_rows_as_a_mask(self):
+        """Test that slicing the Date-sorted frame and comparing codes matches a full boolean mask"""
+        index = DateIndex(self.data.sample(frac=1, random_state=0))
+        self.assertTrue(index.frame["Date"].is_monotonic_increasing)
+        product = self.data["ProductName"].iloc[0]
+        for sales_filter, mask in [
+            (self.sales_filter, self.mask),
+            (SalesFilter(end=pd.Timestamp("2023-03-31")), self.data["Date"] <= "2023-03-31"),
+            (SalesFilter(products=(product,)), self.data["ProductName"] == product),
+        ]:
+            selected = index.select(sales_filter)
+            self.assertEqual(sorted(selected["TransactionID"]), sorted(self.data.loc[mask, "TransactionID"]))
+
+    def test_filtered_analyses_match_analysing_the_filtered_rows(self):
+        """Test that every analysis of a filter view equals the analysis of the masked frame"""
+        analysis = DataAnalysisModule(self.data)
+        view_analysis, results = analysis.view(self.sales_filter)
+        self.assertIs(analysis.view(self.sales_filter)[1], results)
+        expected = DataAnalysisModule(self.data[self.mask].sort_values("Date", kind="stable")).analyze()
+        assert_results_equal(results, expected, TestIncrementalAppend.ANALYSES)
+        self.assertEqual(view_analysis.headline_totals()[1], self.mask.sum())
+
+    def test_empty_views_compute_without_errors(self):
+        """Test that a filter matching no rows gives empty results and NaN quantiles rather than errors"""
+        import pipeline
+        reported = []
+        pipeline.set_error_handler(reported.append)
+        self.addCleanup(pipeline.set_error_handler, None)
+        empty = SalesFilter(start=pd.Timestamp("1990-01-01"), end=pd.Timestamp("1990-01-31"))
+        for approximate in (False, True):
+            with self.subTest(approximate=approximate):
+                results = DataAnalysisModule(self.data).view(empty, approximate)[1]
+                for name in results:
+                    results[name]
+                self.assertEqual(reported, [])
+                self.assertTrue(results["purchase_value_quantiles"].isna().all())
+                self.assertEqual(list(results["purchase_value_quantiles"].index), DataAnalysisModule.PURCHASE_QUANTILES)
+
+    def test_filter_views_include_appended_batches(self):
+        """Test that rows appended after a filter was viewed show up in the refreshed view"""
+        raw = ingested()
+        analysis = DataAnalysisModule(DataProcessingModule(raw.iloc[:5000]).process_data())
+        before = analysis.view(self.sales_filter)[0]
+        analysis.append(raw.iloc[5000:])
+        after = analysis.view(self.sales_filter)[0]
+        self.assertLess(len(before.df), len(after.df))
+        self.assertEqual(len(after.df), self.mask.sum())
+
+
+class TestSketches(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.keys = rng.zipf(1.3, 300_000) % 20_000
+        self.weights = rng.uniform(1, 10, len(self.keys))
+
+    def test_heavy_hitters_bound_the_true_top_totals(self):
+        """Test that chunked Space-Saving + Count-Min finds the exact top keys within the stated overestimate"""
+        from sketches import HeavyHitters
+        hitters = HeavyHitters(capacity=500)
+        for start in range(0, len(self.keys), 50_000):
+            hitters.add(self.keys[start:start + 50_000], self.weights[start:start + 50_000])
+        top, overestimate = hitters.top(10)
+        exact = pd.Series(self.weights).groupby(self.keys).sum()
+        self.assertEqual(list(top.index), list(exact.nlargest(10).index))
+        true = exact[top.index.astype(int)].to_numpy()
+        self.assertTrue(np.all(top.to_numpy() >= true - 1e-6))
+        self.assertTrue(np.all(top.to_numpy() - true <= overestimate + 1e-6))
+        self.assertLessEqual(len(hitters.summary.counts), 500)
+
+    def test_hyperloglog_and_tdigest_stay_within_documented_error(self):
+        """Test that merged HyperLogLog counts and t-digest quantiles are within their documented error"""
+        from sketches import HyperLogLog, TDigest
+        halves = np.array_split(self.keys, 2)
+        counter = HyperLogLog().add(halves[0]).merge(HyperLogLog().add(halves[1]))
+        distinct = len(np.unique(self.keys))
+        self.assertLess(abs(counter.count() - distinct), 3 * counter.relative_error * distinct)
+
+        values = np.sort(self.weights)
+        digest = TDigest().add(self.weights[:100_000]).merge(TDigest().add(self.weights[100_000:]))
+        self.assertLessEqual(len(digest.means), digest.compression)
+        for q in [0.01, 0.5, 0.9, 0.99]:
+            rank = np.searchsorted(values, digest.quantile(q)) / len(values)
+            self.assertLess(abs(rank - q), 1 / digest.compression)
+        self.assertEqual(digest.quantile(1.0), values[-1])
+
+    def test_approximate_analyses_are_labelled_and_close_to_exact(self):
+        """Test that approximate mode answers from sketches, labels the results and keeps exact mode unlabelled"""
+        data = processed()
+        exact = DataAnalysisModule(data).analyze()
+        approximate = DataAnalysisModule(data).view(approximate=True)[1]
+        for name in ["best_selling_products", "frequent_customers", "customer_purchase_frequency",
+                     "top_product_pairs", "distinct_customers", "purchase_value_quantiles"]:
+            self.assertIn("approximate", approximate[name].attrs, name)
+            self.assertNotIn("approximate", exact[name].attrs, name)
+        # Fewer distinct products and customers than counters, so the top-N lists are exact here
+        pd.testing.assert_series_equal(approximate["best_selling_products"], exact["best_selling_products"],
+                                       check_index_type=False, check_categorical=False)
+        pd.testing.assert_frame_equal(approximate["top_product_pairs"], exact["top_product_pairs"])
+        self.assertEqual(list(approximate["frequent_customers"].index), list(exact["frequent_customers"].index))
+        self.assertLess(abs(approximate["distinct_customers"].iloc[0] - data["CustomerID"].nunique()),
+                        0.03 * data["CustomerID"].nunique())
+        pd.testing.assert_series_equal(exact["purchase_value_quantiles"],
+                                       data["TotalPrice"].quantile([0.25, 0.5, 0.75, 0.9, 0.99]),
+                                       check_names=False, check_index_type=False)
+
+    def test_streamed_sketches_answer_approximate_analyses(self):
+        """Test that sketches folded while streaming serve approximate mode without the row-level frame"""
+        from pipeline import SalesSketches
+        data = processed()
+        exact = DataAnalysisModule(data).analyze()
+        sketches = SalesSketches()
+        aggregates = DataIngestionModule.load_aggregates(ENHANCED_CSV, chunksize=2000, sketches=sketches)
+        streamed = DataAnalysisModule.from_aggregates(aggregates, sketches).analyze()
+        self.assertEqual(sketches.rows, len(data))
+        self.assertIn("approximate", streamed["best_selling_products"].attrs)
+        pd.testing.assert_series_equal(streamed["best_selling_products"], exact["best_selling_products"],
+                                       check_index_type=False, check_categorical=False)
+        self.assertLess(abs(streamed["distinct_customers"].iloc[0] - data["CustomerID"].nunique()),
+                        0.03 * data["CustomerID"].nunique())
+        pd.testing.assert_series_equal(streamed["monthly_sales"], exact["monthly_sales"], check_names=False)
+
+
+class TestPartitionedIngestion(unittest.TestCase):
+
+    def test_partitions_match_concatenated_file(self):
+        """Test that pooled per-file aggregation equals processing the concatenated files, duplicates included"""
+        data = pd.read_csv(ENHANCED_CSV)
+        parts = [data.iloc[:4000], data.iloc[3900:7000], data.iloc[7000:], data.iloc[:50]]
+        with tempfile.TemporaryDirectory() as directory:
+            for position, part in enumerate(parts):
+                part.to_csv(os.path.join(directory, f"store_{position}.csv"), index=False)
+            aggregates = DataIngestionModule.load_partitions(directory, max_workers=2)
+
+        concatenated = pd.concat(parts).to_csv(index=False)
+        expected = DataAnalysisModule(
+            DataProcessingModule(DataIngestionModule.load_data(io.StringIO(concatenated))).process_data()).analyze()
+        result = DataAnalysisModule.from_aggregates(aggregates).analyze()
+
+        self.assertEqual(aggregates.rows, len(data))
+        assert_results_equal(result, expected, TestIncrementalAppend.ANALYSES, check_names=False)
+
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+@unittest.skipUnless(duckdb, "duckdb is not installed")
+class TestDuckDBBackend(unittest.TestCase):
+
+    def assert_same_result(self, result, expected):
+        if isinstance(result, pd.DataFrame):
+            pd.testing.assert_frame_equal(result, expected)
+        elif isinstance(result, pd.Series):
+            pd.testing.assert_series_equal(result, expected)
+        elif hasattr(result, "cells"):
+            # Sums of int8 quantities are int8 cells in pandas and int64 in DuckDB
+            pd.testing.assert_frame_equal(result.cells, expected.cells, check_dtype=False)
+        elif hasattr(result, "product_table"):
+            pd.testing.assert_frame_equal(result.product_table, expected.product_table, check_dtype=False)
+            pd.testing.assert_frame_equal(result.by_month, expected.by_month)
+        else:
+            self.assertEqual(result, expected)
+
+    def test_analyses_match_pandas_backend(self):
+        """Test that every registered analysis computed in DuckDB equals the pandas result, on both datasets"""
+        from duckdb_backend import DuckDBAnalysisModule
+        from pipeline import ANALYSES
+        for path in ("supermarket_sales.csv", ENHANCED_CSV):
+            expected = DataAnalysisModule(processed(path)).analyze()
+            with tempfile.TemporaryDirectory() as directory:
+                analysis = DuckDBAnalysisModule(path, memory_limit="256MB", temp_directory=directory)
+                result = analysis.analyze()
+                for name in ANALYSES:
+                    with self.subTest(path=path, analysis=name):
+                        self.assert_same_result(result[name], expected[name])
+                analysis.close()
+
+    def test_each_analysis_can_be_read_first(self):
+        """Test that every analysis computed first on a fresh DuckDB module creates the tables it queries"""
+        from duckdb_backend import DuckDBAnalysisModule
+        from pipeline import ANALYSES
+        expected = DataAnalysisModule(processed("supermarket_sales.csv")).analyze()
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ANALYSES:
+                with self.subTest(analysis=name):
+                    analysis = DuckDBAnalysisModule("supermarket_sales.csv", temp_directory=directory)
+                    self.assert_same_result(analysis.analyze([name])[name], expected[name])
+                    analysis.close()
+
+    def test_dashboard_load_cleans_rows_like_duckdb(self):
+        """Test that the pruned dashboard load judges duplicates and missing values on the same columns as DuckDB"""
+        from duckdb_backend import DuckDBAnalysisModule
+        from main import SupermarketSalesApp
+        data = pd.read_csv(ENHANCED_CSV, nrows=200)
+        # A row repeated under another ProductID is not a duplicate, one missing its ProductID is dropped
+        data = pd.concat([data, data.iloc[:5].assign(ProductID=999), data.iloc[5:8].assign(ProductID=None)])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sales.csv")
+            data.to_csv(path, index=False)
+            loaded = SupermarketSalesApp.load_dataset(path, "sales", ColumnarCache(directory))
+            analysis = DuckDBAnalysisModule(path, temp_directory=directory)
+            self.assertEqual(len(loaded), analysis.headline_totals()[1])
+            self.assertEqual(len(loaded), 205)
+            self.assertEqual(list(loaded.columns), SupermarketSalesApp.DASHBOARD_COLUMNS)
+            analysis.close()
+
+    def test_close_removes_database_files(self):
+        """Test that closing the backend deletes its on-disk database and rejects row-level access"""
+        from duckdb_backend import DuckDBAnalysisModule
+        with tempfile.TemporaryDirectory() as directory:
+            analysis = DuckDBAnalysisModule("supermarket_sales.csv", temp_directory=directory)
+            self.assertEqual(analysis.headline_totals()[1], len(
+                DataProcessingModule(DataIngestionModule.load_data("supermarket_sales.csv")).process_data()))
+            with self.assertRaises(ValueError):
+                analysis.rows()
+            with self.assertRaises(ValueError):
+                analysis.append(pd.read_csv("supermarket_sales.csv", nrows=5))
+            analysis.close()
+            analysis.close()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_closing_an_upload_deletes_its_spooled_copy(self):
+        """Test that an uploaded file is spooled next to the database and deleted with it"""
+        from duckdb_backend import DuckDBAnalysisModule
+        with open("supermarket_sales.csv", "rb") as handle:
+            upload = io.BytesIO(handle.read())
+        with tempfile.TemporaryDirectory() as directory:
+            analysis = DuckDBAnalysisModule.from_upload(upload, temp_directory=directory)
+            self.assertEqual(analysis.headline_totals()[1], len(processed("supermarket_sales.csv")))
+            analysis.close()
+            self.assertEqual(os.listdir(directory), [])
+
+
+class TestBatchCli(unittest.TestCase):
+
+    def test_cli_writes_results_without_ui_libraries(self):
+        """Test that the headless runner writes every result and never imports Streamlit, Plotly or Matplotlib"""
+        with tempfile.TemporaryDirectory() as directory:
+            script = (
+                "import sys, cli\n"
+                f"cli.main(['supermarket_sales.csv', '--output-dir', {directory!r}])\n"
+                "loaded = [name for name in ('streamlit', 'plotly', 'matplotlib') if name in sys.modules]\n"
+                "assert not loaded, loaded\n"
+            )
+            subprocess.run([sys.executable, "-c", script], check=True, capture_output=True)
+            from pipeline import ANALYSES
+            written = sorted(os.listdir(directory))
+            self.assertEqual(written, sorted(f"{name}.json" for name in ANALYSES if name != "product_search_index"))
+            best = pd.read_json(os.path.join(directory, "best_selling_products.json"))
+            self.assertEqual(list(best.columns), ["ProductName", "Quantity"])
+
+
+    def test_cli_fails_on_input_it_cannot_read_to_the_end(self):
+        """Test that a parse error partway through a streamed file fails the run instead of writing partial results"""
+        import cli
+        lines = open("supermarket_sales.csv").read().splitlines()
+        lines.insert(500, lines[500] + ",extra,fields")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "broken.csv")
+            with open(path, "w") as handle:
+                handle.write("\n".join(lines))
+            with self.assertLogs(level="ERROR"):
+                with self.assertRaises(Exception):
+                    DataIngestionModule.load_aggregates(path, chunksize=100)
+                output = os.path.join(directory, "reports")
+                self.assertEqual(cli.main([path, "--chunksize", "100", "--output-dir", output]), 1)
+                self.assertEqual(cli.main([os.path.join(directory, "missing.csv"), "--output-dir", output]), 1)
+            self.assertFalse(os.path.exists(output))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generated_data_matches_sales_schema(self):
+        """Test that synthetic data has the CSV columns and the requested number of customers and products"""
+        from benchmark import generate_sales
+        df = generate_sales(2000, customers=100, products=30, basket_width=5)
+        self.assertEqual(list(df.columns), list(pd.read_csv(ENHANCED_CSV, nrows=1).columns))
+        self.assertLessEqual(df["CustomerID"].nunique(), 100)
+        self.assertLessEqual(df.groupby("CustomerID")["ProductName"].nunique().max(), 5)
+
+    def test_benchmark_records_every_stage(self):
+        """Test that a small benchmark run reports timing for ingestion, processing, analyses and search"""
+        from benchmark import ANALYSIS_METHODS, run_benchmarks
+        records = run_benchmarks(1000, products=20)
+        stages = [record["stage"] for record in records]
+        self.assertTrue({"load_data", "process_data", "product_search"}.issubset(stages))
+        self.assertTrue(set(ANALYSIS_METHODS).issubset(stages))
+        self.assertTrue(all(record["seconds"] >= 0 and record["rows"] == 1000 for record in records))
+
+
+class TestColdStart(unittest.TestCase):
+
+    def test_imports_defer_heavy_libraries(self):
+        """Test that the pipeline imports without UI, plotting or optional libraries and the dashboard without plotting"""
+        script = (
+            "import sys, {module}\n"
+            "loaded = [name for name in {heavy!r} if name in sys.modules]\n"
+            "assert not loaded, loaded\n"
+        )
+        for module, heavy in [("pipeline", ("streamlit", "plotly", "matplotlib", "scipy", "duckdb")),
+                              ("main", ("plotly.express", "matplotlib", "scipy", "duckdb"))]:
+            with self.subTest(module=module):
+                subprocess.run([sys.executable, "-c", script.format(module=module, heavy=heavy)], check=True,
+                               capture_output=True)
+
+    def test_importing_the_dashboard_leaves_the_pipeline_untouched(self):
+        """Test that importing main does not install the dashboard's error handler; configure_page() does"""
+        script = (
+            "import pipeline, main\n"
+            "assert pipeline._error_handler is None, pipeline._error_handler\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True, capture_output=True)
+
+    def test_benchmark_records_import_time(self):
+        """Test that the benchmark reports a cold import time per entry point"""
+        from benchmark import measure_imports
+        records = measure_imports(["pipeline"], repeat=1)
+        self.assertEqual([record["stage"] for record in records], ["import_pipeline"])
+        self.assertGreater(records[0]["seconds"], 0)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_analysis_stages_are_logged_as_structured_records(self):
+        """Test that computing an analysis emits stage records with timing, rows and cache status"""
+        import profiling
+        frame = processed()
+        results = DataAnalysisModule(frame).analyze()
+        with self.assertLogs("pipeline.stages", level="INFO") as logs:
+            results["regional_sales"]
+            results["regional_sales"]
+        records = [log.stage_record for log in logs.records]
+        self.assertEqual([record["stage"] for record in records], ["intermediate:cube", "intermediate:regional_sales", "regional_sales"])
+        self.assertEqual(records[-1]["rows_in"], len(frame))
+        self.assertEqual(records[-1]["rows_out"], len(results["regional_sales"]))
+        self.assertEqual(records[-1]["cache"], "miss")
+        self.assertGreaterEqual(records[-1]["seconds"], 0)
+        self.assertIs(profiling.stage_log.records()[-1], records[-1])
+
+    def test_nested_stage_keeps_parent_peak_memory(self):
+        """Test that a nested stage does not reset the traced peak of the stage around it"""
+        from profiling import measure
+        records = []
+        with measure("outer", records):
+            block = np.ones(2_000_000)
+            del block
+            with measure("inner", records):
+                pass
+        inner, outer = records
+        self.assertGreater(outer["peak_mb"], 10)
+        self.assertLess(inner["peak_mb"], 1)
+
+    def test_concurrent_stages_keep_their_peaks(self):
+        """Test that a stage opened on another thread neither hides a peak nor stops tracing under it"""
+        import threading
+        import tracemalloc
+        from profiling import measure
+        records, allocated, measured = [], threading.Event(), threading.Event()
+
+        def other():
+            allocated.wait()
+            with measure("other", records):
+                pass
+            measured.set()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        with measure("outer", records):
+            block = np.ones(2_000_000)
+            del block
+            allocated.set()
+            measured.wait()
+            self.assertTrue(tracemalloc.is_tracing())
+        thread.join()
+        self.assertGreater(records[-1]["peak_mb"], 10)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class TestDownsampling(unittest.TestCase):
+
+    def test_lttb_keeps_endpoints_and_peaks_within_budget(self):
+        """Test that LTTB returns at most the point budget and keeps the first, last and extreme points"""
+        from downsampling import lttb
+        values = np.sin(np.linspace(0, 20, 10_000))
+        values[4321] = 50
+        series = pd.Series(values, index=pd.period_range("1200-01", periods=10_000, freq="M"))
+        sampled = lttb(series, 200)
+        self.assertEqual(len(sampled), 200)
+        self.assertEqual(sampled.index[0], series.index[0])
+        self.assertEqual(sampled.index[-1], series.index[-1])
+        self.assertIn(series.index[4321], sampled.index)
+        self.assertTrue(sampled.index.is_monotonic_increasing)
+        short = series.head(100)
+        self.assertIs(lttb(short, 200), short)
+
+    def test_top_n_groups_the_rest_into_other(self):
+        """Test that categorical bars keep the largest categories and sum the remainder into Other"""
+        from downsampling import top_n_with_other
+        series = pd.Series(np.arange(1, 31, dtype=float), index=[f"P{i}" for i in range(30)])
+        bars = top_n_with_other(series, 5)
+        self.assertEqual(list(bars.index), ["P29", "P28", "P27", "P26", "P25", "Other"])
+        self.assertEqual(bars.sum(), series.sum())
+
+    def test_pages_cover_every_row_once(self):
+        """Test that paginated tables return each row exactly once and clamp out-of-range pages"""
+        from downsampling import page_count, paginate
+        frame = pd.DataFrame({"value": range(250)})
+        pages = [paginate(frame, page, 100) for page in range(1, page_count(len(frame), 100) + 1)]
+        self.assertEqual([len(page) for page in pages], [100, 100, 50])
+        pd.testing.assert_frame_equal(pd.concat(pages), frame)
+        pd.testing.assert_frame_equal(paginate(frame, 99, 100), pages[-1])
+
+
+class TestBackgroundAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.processed = processed()
+
+    def test_prefetched_results_match_on_demand_results(self):
+        """Test that analyses computed on a thread pool equal those computed on first access"""
+        from concurrent.futures import ThreadPoolExecutor
+        expected = DataAnalysisModule(self.processed).analyze()
+        analysis = DataAnalysisModule(self.processed)
+        self.assertEqual(analysis.headline_totals(), (self.processed["TotalPrice"].sum(), len(self.processed)))
+        results = analysis.analyze()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results.prefetch(executor)
+        for name in TestIncrementalAppend.ANALYSES:
+            self.assertTrue(results.is_computed(name), name)
+            self.assertFalse(results.pending(name))
+        assert_results_equal(results, expected, TestIncrementalAppend.ANALYSES)
+        cube = results["sales_cube"]
+        self.assertEqual(analysis.headline_totals(), (cube.grand_total("TotalPrice"), cube.grand_total("Transactions")))
+
+    def test_cancel_drops_queued_jobs_and_reset_discards_stale_results(self):
+        """Test that queued jobs can be cancelled and results finished after reset() are not memoized"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from pipeline import AnalysisResults
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return pd.Series([1.0])
+
+        results = AnalysisResults()
+        results.register("slow", slow)
+        results.register("queued", lambda: pd.Series([2.0]))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results.prefetch(executor)
+            started.wait(5)
+            self.assertTrue(results.pending("queued"))
+            self.assertEqual(results.cancel(), 1)
+            results.reset()
+            release.set()
+        self.assertFalse(results.is_computed("slow"))
+        self.assertFalse(results.is_computed("queued"))
+        self.assertEqual(results["queued"].iloc[0], 2.0)
+
+    def test_background_errors_are_reported_to_the_reading_thread(self):
+        """Test that a failed background job is reported where its result is read and unknown names raise"""
+        import threading
+        import pipeline
+        from concurrent.futures import ThreadPoolExecutor
+        calls, reported = [], []
+
+        def failing():
+            calls.append(threading.get_ident())
+            raise ValueError("boom")
+
+        results = pipeline.AnalysisResults()
+        results.register("failing", failing)
+        pipeline.set_error_handler(reported.append)
+        self.addCleanup(pipeline.set_error_handler, None)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results.prefetch(executor)
+        self.assertEqual(reported, [])
+        self.assertTrue(results["failing"].empty)
+        self.assertEqual(reported, ["Error in failing analysis: boom"])
+        self.assertEqual(len(calls), 1)
+        with self.assertRaises(KeyError):
+            results["missing"]
+        self.assertIsNone(results.get("missing"))
+
+
+class TestAnalysisRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.processed = processed()
+
+    def test_plugin_analysis_reuses_shared_intermediates(self):
+        """Test that a registered plugin is served by analyze() and each shared intermediate is computed once"""
+        from concurrent.futures import ThreadPoolExecutor
+        from pipeline import ANALYSES, register_analysis
+
+        @register_analysis("product_months", requires=("cube",))
+        def product_months(analysis):
+            return analysis.cube().cells.groupby(["ProductName", "Month"], observed=True)["TotalPrice"].sum()
+        self.addCleanup(ANALYSES.pop, "product_months")
+
+        results = DataAnalysisModule(self.processed).analyze()
+        with self.assertLogs("pipeline.stages", level="INFO") as logs:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results.prefetch(executor)
+        stages = [log.stage_record["stage"] for log in logs.records]
+        self.assertEqual(stages.count("intermediate:cube"), 1)
+        self.assertEqual(stages.count("intermediate:customer_summary"), 1)
+        self.assertTrue(all(results.is_computed(name) for name in results))
+        self.assertAlmostEqual(results["product_months"].sum(), self.processed["TotalPrice"].sum())
+
+    def test_declared_columns_prune_loading(self):
+        """Test that loading only the declared columns of some analyses gives the same results"""
+        from pipeline import required_columns, required_intermediates
+        self.assertEqual(required_intermediates(["best_selling_products"]), ["cube", "product_quantity", "sketches"])
+        self.assertEqual(required_intermediates(["customer_rfm"], approximate=False), ["customer_summary", "rfm"])
+        columns = required_columns(["customer_recency", "customer_rfm"])
+        self.assertEqual(sorted(columns), ["CustomerID", "Date", "TotalPrice"])
+
+        pruned = DataIngestionModule.load_data(ENHANCED_CSV,
+                                               columns + list(DataProcessingModule.COLUMNS))
+        self.assertNotIn("ProductName", pruned)
+        expected = DataAnalysisModule(self.processed).analyze(["customer_recency", "customer_rfm"])
+        results = DataAnalysisModule(DataProcessingModule(pruned).process_data()).analyze(["customer_recency",
+                                                                                             "customer_rfm"])
+        self.assertEqual(list(results), ["customer_recency", "customer_rfm"])
+        pd.testing.assert_series_equal(results["customer_recency"], expected["customer_recency"])
+        pd.testing.assert_frame_equal(results["customer_rfm"], expected["customer_rfm"])
+
+
+class TestIngestionSchema(unittest.TestCase):
+
+    def test_schema_is_applied_at_read_time(self):
+        """Test that names are categorical, IDs are downcast and Date is parsed during ingestion"""
+        df = ingested()
+        self.assertIsInstance(df["ProductName"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(df["Region"].dtype, pd.CategoricalDtype)
+        self.assertEqual(df["Quantity"].dtype, np.int8)
+        self.assertEqual(df["PriceperUnit"].dtype, np.float32)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df["Date"]))
+        self.assertLess(df.memory_usage(deep=True).sum(),
+                        pd.read_csv(ENHANCED_CSV).memory_usage(deep=True).sum() / 2)
+
+    def test_compact_totals_match_inferred_types(self):
+        """Test that processing compact dtypes gives the same totals as inferred dtypes"""
+        compact = processed()
+        inferred = DataProcessingModule(pd.read_csv(ENHANCED_CSV)).process_data()
+        self.assertEqual(compact["TotalPrice"].dtype, np.float64)
+        self.assertAlmostEqual(compact["TotalPrice"].sum(), inferred["TotalPrice"].sum())
+
+
+class TestColumnarCache(unittest.TestCase):
+
+    def test_processed_frame_round_trips_with_column_selection(self):
+        """Test that a cached processed frame reloads with dtypes intact and only the requested columns"""
+        df = DataProcessingModule(DataIngestionModule.load_data("supermarket_sales.csv")).process_data()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ColumnarCache(directory)
+            self.assertIsNone(cache.load("v:abc"))
+            cache.save("v:abc", df)
+            loaded = cache.load("v:abc", columns=["ProductName", "Date", "TotalPrice"])
+            self.assertEqual(list(loaded.columns), ["ProductName", "Date", "TotalPrice"])
+            pd.testing.assert_frame_equal(loaded, df[["ProductName", "Date", "TotalPrice"]].reset_index(drop=True))
+            self.assertTrue(cache.invalidate("v:abc"))
+            self.assertNotIn("v:abc", cache)
+
+    def test_failed_writes_leave_no_temporary_files(self):
+        """Test that a frame Parquet cannot store is not cached and its partial file is removed"""
+        unwritable = pd.DataFrame({"Mixed": [1, "a", 2.5]})
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ColumnarCache(directory)
+            with self.assertLogs(level="ERROR"):
+                cache.save("v:abc", unwritable)
+            self.assertNotIn("v:abc", cache)
+            self.assertEqual(os.listdir(directory), [])
+
+
+class TestFigureCache(unittest.TestCase):
+
+    def build(self, name):
+        import plotly.express as px
+        self.builds.append(name)
+        series = pd.Series([3, 1, 2], index=["a", "b", "c"])
+        return px.bar(series, x=series.index, y=series.values, title=name)
+
+    def setUp(self):
+        self.builds = []
+
+    def test_figures_are_built_once_per_dataset_view_and_chart(self):
+        """Test that reruns re-emit the cached figure and a different view or dataset builds its own"""
+        from figure_cache import FigureCache
+        cache = FigureCache()
+        first = cache.figure("data-1", None, "sales", lambda: self.build("sales"))
+        again = cache.figure("data-1", None, "sales", lambda: self.build("sales"))
+        self.assertEqual(self.builds, ["sales"])
+        self.assertEqual(again.to_json(), first.to_json())
+        self.assertEqual(again.layout.title.text, "sales")
+        cache.figure("data-1", ("filtered", False), "sales", lambda: self.build("sales"))
+        cache.figure("data-2", None, "sales", lambda: self.build("sales"))
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 3, 3))
+
+        self.assertEqual(cache.invalidate("data-1"), 2)
+        cache.figure("data-1", None, "sales", lambda: self.build("sales"))
+        self.assertEqual(len(self.builds), 4)
+
+    def test_memory_is_bounded_least_recently_used_first(self):
+        """Test that figures beyond the byte budget are evicted least recently used first"""
+        from figure_cache import FigureCache
+        size = len(self.build("a").to_json())
+        cache = FigureCache(max_bytes=2 * size + size // 2)
+        for name in ["a", "b"]:
+            cache.figure("data", None, name, lambda: self.build(name))
+        cache.figure("data", None, "a", lambda: self.build("a"))
+        cache.figure("data", None, "c", lambda: self.build("c"))
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        self.builds.clear()
+        cache.figure("data", None, "a", lambda: self.build("a"))
+        cache.figure("data", None, "b", lambda: self.build("b"))
+        self.assertEqual(self.builds, ["b"])
+
+
+class TestDatasetStore(unittest.TestCase):
+
+    def setUp(self):
+        self.df = DataProcessingModule(DataIngestionModule.load_data("supermarket_sales.csv")).process_data()
+
+    def test_identical_uploads_share_one_frame(self):
+        """Test that sessions acquiring the same key share a single load and a reference count"""
+        from dataset_store import DatasetStore
+        store, loads = DatasetStore(), []
+        first = store.acquire("v:a", lambda: loads.append(1) or self.df)
+        second = store.acquire("v:a", lambda: loads.append(1) or self.df.copy())
+        self.assertEqual(len(loads), 1)
+        self.assertIs(first.df, second.df)
+        self.assertEqual(store.refcount("v:a"), 2)
+        first.release()
+        first.release()
+        self.assertEqual(store.refcount("v:a"), 1)
+
+    def test_unreferenced_datasets_spill_and_reload(self):
+        """Test that only unreferenced datasets are evicted over budget, spilled to disk and read back"""
+        from dataset_store import DatasetStore
+        with tempfile.TemporaryDirectory() as directory:
+            store = DatasetStore(max_bytes=1, spill_cache=ColumnarCache(directory))
+            evicted = []
+            store.evict_listeners.append(evicted.append)
+            handle = store.acquire("v:a", lambda: self.df)
+            store.acquire("v:b", lambda: self.df.copy()).release()
+            self.assertEqual(evicted, ["v:b"])
+            self.assertIn("v:a", store)
+            handle.release()
+            self.assertEqual(evicted, ["v:b", "v:a"])
+            self.assertEqual(len(store), 0)
+
+            reloaded = store.acquire("v:a", lambda: self.fail("spilled dataset was rebuilt"))
+            pd.testing.assert_frame_equal(reloaded.df, self.df.reset_index(drop=True))
+
+
+class TestPipelineCache(unittest.TestCase):
+
+    def test_content_hash_matches_for_path_and_file_object(self):
+        """Test that a path and an open file with the same bytes share a cache key"""
+        with open("supermarket_sales.csv", "rb") as handle:
+            self.assertEqual(cache_key("supermarket_sales.csv"), cache_key(handle))
+            self.assertEqual(handle.tell(), 0)
+        self.assertNotEqual(content_hash("supermarket_sales.csv"), content_hash("supermarket_sales_enhanced.csv"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test that the cache keeps at most max_entries and evicts the oldest unused entry"""
+        cache = PipelineCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_memory_budget_and_invalidation(self):
+        """Test that entries beyond the byte budget are evicted and invalidation drops an entry"""
+        cache = PipelineCache(max_bytes=100)
+        cache.put("a", "x", nbytes=60)
+        cache.put("b", "y", nbytes=60)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(cache.invalidate("b"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_appended_keys_follow_batch_order(self):
+        """Test that the same batches appended in another order get another key derived from the base"""
+        from pipeline_cache import appended_key, derives_from
+        key = cache_key("supermarket_sales.csv")
+        forward, backward = appended_key(key, ["a", "b"]), appended_key(key, ["b", "a"])
+        self.assertNotEqual(forward, backward)
+        self.assertEqual(forward, appended_key(key, ["a", "b"]))
+        self.assertTrue(derives_from(forward, key) and derives_from(backward, key))
+
+    def test_entries_are_remeasured_as_results_land(self):
+        """Test that a shared frame counts once and lazily computed results grow the entry until it is evicted"""
+        df = DataProcessingModule(DataIngestionModule.load_data("supermarket_sales.csv")).process_data()
+        analysis = DataAnalysisModule(df)
+        results = analysis.analyze()
+        cache = PipelineCache()
+        cache.put("a", (analysis, results))
+        frame_bytes = df.memory_usage(deep=True).sum()
+        self.assertLess(cache.total_bytes, 1.5 * frame_bytes)
+
+        analysis.on_result = lambda name: cache.remeasure("a")
+        results = cache.get("a")[0].analyze()
+        cache.put("b", "small", nbytes=1)
+        cache.max_bytes = cache.total_bytes + 1000
+        results["customer_rfm"]
+        self.assertIn("b", cache)
+        self.assertNotIn("a", cache)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,9 +1,8 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import time
 
-from main import SupermarketSalesApp
+from main import SupermarketSalesApp, configure_page
 
 
 class UserAcceptanceTesting:
@@ -44,11 +43,10 @@ class UserAcceptanceTesting:
         with st.expander("📊 Dashboard Data Test"):
             if self.file is not None:
                 app = self.app
-                df = app.analysis.df
+                # Through the analysis, as the duckdb backend holds no row-level frame
+                total_sales, total_transactions = app.analysis.headline_totals()
 
-                if not df.empty:
-                    total_sales = df["TotalPrice"].sum()
-                    total_transactions = df.shape[0]
+                if total_transactions:
                     avg_sales = total_sales / total_transactions if total_transactions else 0
 
                     st.write("**Data Summary:**")
@@ -76,7 +74,7 @@ class UserAcceptanceTesting:
         with st.expander("⏱️ Performance Test"):
             if self.file is not None:
                 start = time.time()
-                _ = self.app.analysis.df.describe()
+                _ = self.app.analysis.cube().cells.describe()
                 end = time.time()
                 duration = round(end - start, 3)
                 st.write(f"Dashboard data processed in **{duration} seconds**.")
@@ -95,6 +93,7 @@ class UserAcceptanceTesting:
 
 
 if __name__ == "__main__":
+    configure_page()
     uploaded_file = st.sidebar.file_uploader("📂 Upload CSV File", type=["csv"])
     if uploaded_file is not None:
         uat = UserAcceptanceTesting(uploaded_file)